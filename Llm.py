@@ -2,12 +2,21 @@
 Llm.py
 Handles chat, tool calling, context saving/loading, model loading...
 """
-from ollama import Client
-from ollama._types import ResponseError
+import asyncio
+import base64
 import json
 import os
+import time
+from collections import OrderedDict
 
 import conf_module
+from context_budget import entry_tokens, truncate_entry
+from conversation import Conversation
+from limiter import KeyedLimiter
+from log_sink import log_response
+from ollama_pool import pool
+import prompt_cache
+from retry import LatencyTracker, attempt_timeout, backoff, hedged, is_retryable, with_retries
 from web_search import browse, gif
 import scripting
 from rag_embedding import write_memory
@@ -22,9 +31,29 @@ if conf_module.load_conf('HOST_OPTIMIZATIONS'):
         os.environ["OLLAMA_KEEP_ALIVE"] = "-1"
         os.environ["OLLAMA_FLASH_ATTENTION"] = "true"
 
-ollama_client = Client(
-    host=LINK
-)
+# Max concurrent requests per model (on each host) and per Ollama host
+model_limits = KeyedLimiter(conf_module.load_conf('MAX_CONCURRENT_PER_MODEL'))
+host_limits = KeyedLimiter(conf_module.load_conf('MAX_CONCURRENT_PER_HOST'))
+
+# Recent chat request durations per model, to decide when to hedge
+chat_latency = LatencyTracker(min_samples=conf_module.load_conf('HEDGE_MIN_SAMPLES'))
+
+# Max concurrent runs per tool
+tool_limits = KeyedLimiter(conf_module.load_conf('TOOL_MAX_CONCURRENT'), conf_module.load_conf('TOOL_LIMITS'))
+
+# /api/show results, per model, and when it last failed
+model_info = {}
+model_info_failed = {}
+
+MODEL_INFO_RETRY = 30 # Seconds before asking /api/show again after it failed
+FALLBACK_CONTEXT_WINDOW = 4096 # Context size used while the model's is unknown and CONTEXT_WINDOW is None
+
+SUMMARY_PREFIX = "(Summary of earlier conversation)\n"
+IMAGE_DROPPED_NOTE = " (image no longer shown)"
+RETRY_LATER = "couldn't generate the message. Please retry later." # Reply when Ollama kept failing until REQUEST_DEADLINE
+
+# Base64 encoding of recently sent images, per path
+encoded_images = OrderedDict()
 
 tools = [{
         'type': 'function',
@@ -100,39 +129,141 @@ tools = [{
     }
 ]
 
-context = []
+async def ollama_chat(route=None, deadline: float = None, retries: int = None, **kwargs):
+    """Send a chat request to the best Ollama host within the per-model and per-host concurrency limits.
+    Transient errors and attempts slower than REQUEST_ATTEMPT_TIMEOUT are retried with backoff until the deadline,
+    on another host when there is one. With HEDGE_REQUESTS, a request slower than
+    the HEDGE_PERCENTILE of recent ones is duplicated on another host and the first answer wins.
+
+    Args:
+        route (optional): Sticky routing key, usually the conversation id, so it stays on a host with a warm cache. Defaults to None.
+        deadline (float, optional): time.monotonic() value to give up at. Defaults to REQUEST_DEADLINE seconds from now.
+        retries (int, optional): Max retries on transient errors. Defaults to REQUEST_RETRIES.
+        **kwargs: Arguments of `AsyncClient.chat`. Must contain `model`, and must not stream.
+
+    Raises:
+        asyncio.TimeoutError: If the deadline is reached.
+        Exception: Fatal errors, or the last transient error once out of retries.
 
-logs = []
+    Returns:
+        ChatResponse: The response from Ollama.
+    """
+    model = kwargs['model']
+    kwargs.setdefault('keep_alive', conf_module.load_conf('KEEP_ALIVE'))
+    if deadline is None:
+        deadline = time.monotonic() + conf_module.load_conf('REQUEST_DEADLINE')
+    if retries is None:
+        retries = conf_module.load_conf('REQUEST_RETRIES')
+
+    hedge_delay = None
+    if conf_module.load_conf('HEDGE_REQUESTS') and len(pool.hosts) > 1:
+        hedge_delay = chat_latency.percentile(model, conf_module.load_conf('HEDGE_PERCENTILE'))
+
+    async def send(route, exclude, used: list):
+        async with pool.use(model, route, exclude) as host:
+            used.append(host)
+            async with model_limits.hold((host.link, model)), host_limits.hold(host.link):
+                started = time.monotonic()
+                response = await host.client.chat(**kwargs)
+        chat_latency.record(model, time.monotonic() - started)
+        return response
+
+    tried = [] # Hosts of the previous attempts, a retry avoids the last one
+
+    async def attempt():
+        used = []
+        previous = tried[-1] if tried else None
+        try:
+            return await hedged(
+                lambda: send(route, previous, used),
+                lambda: send(None, used[0] if used else previous, used),
+                hedge_delay
+            )
+        finally:
+            tried.extend(used)
+
+    return await with_retries(
+        attempt, retries, deadline, conf_module.load_conf('RETRY_BASE_DELAY'), conf_module.load_conf('RETRY_MAX_DELAY'),
+        timeout=conf_module.load_conf('REQUEST_ATTEMPT_TIMEOUT')
+    )
 
-def load(model: str = DEFAULT_MODEL) -> str:
+
+async def load(model: str = DEFAULT_MODEL) -> str:
     """Infer with a model in streaming to load it. Returns when the model output the first token.
+    Transient errors are retried with backoff until REQUEST_DEADLINE.
     
     Args:
         model (str, optional): The model to load. Defaults to DEFAULT_MODEL.
 
+    Raises:
+        Exception: The last error if the model couldn't be loaded.
+
     Returns:
         str: "model loaded" when the model is loaded.
     """
     if model is None:
         model = DEFAULT_MODEL
 
-    # start a streaming chat
-    stream = ollama_client.chat(
-        model=model,
-        messages=[{'role': 'user', 'content': 'Hi'}],
-        stream=True
+    async def attempt():
+        async with pool.use(model) as host, model_limits.hold((host.link, model)), host_limits.hold(host.link):
+            # start a streaming chat
+            stream = await host.client.chat(
+                model=model,
+                messages=[{'role': 'user', 'content': 'Hi'}],
+                stream=True,
+                keep_alive=conf_module.load_conf('KEEP_ALIVE')
+            )
+
+            async for first in stream: # Returns on the first token
+                break
+            await stream.aclose()
+
+    # Loading a large model can take longer than REQUEST_ATTEMPT_TIMEOUT, attempts only share the deadline
+    await with_retries(
+        attempt, conf_module.load_conf('REQUEST_RETRIES'), time.monotonic() + conf_module.load_conf('REQUEST_DEADLINE'),
+        conf_module.load_conf('RETRY_BASE_DELAY'), conf_module.load_conf('RETRY_MAX_DELAY')
     )
+    return "model loaded"
 
-    try:
-        first = next(stream) # Fails if no stream
-        stream.close()
-    except StopIteration:
-        pass
 
-    return "model loaded"
+async def show_model(model: str = DEFAULT_MODEL) -> dict:
+    """Get the details of a model from /api/show, cached per model. Transient errors are retried within
+    REQUEST_ATTEMPT_TIMEOUT; if Ollama still can't answer, an empty dict is returned (callers fall back
+    to defaults) and it isn't asked again for MODEL_INFO_RETRY seconds.
+
+    Args:
+        model (str, optional): The model to describe. Defaults to DEFAULT_MODEL
 
+    Returns:
+        dict: The /api/show response, or {} if unavailable.
+    """
+    if model is None:
+        model = DEFAULT_MODEL
 
-def get_model_capabilities(model: str = DEFAULT_MODEL) -> list:
+    if model in model_info:
+        return model_info[model]
+    if time.monotonic() - model_info_failed.get(model, -MODEL_INFO_RETRY) < MODEL_INFO_RETRY:
+        return {}
+
+    async def attempt():
+        async with pool.use(model) as host:
+            response = await host.client._request_raw("POST", "/api/show", json={"name": model})
+        return response.json()
+
+    try:
+        model_info[model] = await with_retries(
+            attempt, conf_module.load_conf('REQUEST_RETRIES'),
+            time.monotonic() + conf_module.load_conf('REQUEST_ATTEMPT_TIMEOUT'),
+            conf_module.load_conf('RETRY_BASE_DELAY'), conf_module.load_conf('RETRY_MAX_DELAY')
+        )
+    except Exception as e:
+        print(f"[show_model] Couldn't get the details of {model}: {e!r}")
+        model_info_failed[model] = time.monotonic()
+        return {}
+    return model_info[model]
+
+
+async def get_model_capabilities(model: str = DEFAULT_MODEL) -> list:
     """Get the capabilities of a model.
 
     Args:
@@ -141,45 +272,116 @@ def get_model_capabilities(model: str = DEFAULT_MODEL) -> list:
     Returns:
         list: List of capabilities.
     """
+    info = await show_model(model)
+    capabilities = info.get("capabilities", [])
+    return capabilities
+
+
+async def context_window(model: str = DEFAULT_MODEL) -> int:
+    """Get the context size (num_ctx) to request for a model: its trained context length, capped by CONTEXT_WINDOW.
+
+    Args:
+        model (str, optional): The model. Defaults to DEFAULT_MODEL
+
+    Returns:
+        int: The context size in tokens, CONTEXT_WINDOW (or FALLBACK_CONTEXT_WINDOW) if the model's is unknown.
+    """
+    info = await show_model(model)
+    lengths = [v for k, v in info.get("model_info", {}).items() if k.endswith(".context_length")]
+    max_window = conf_module.load_conf('CONTEXT_WINDOW')
+
+    if not lengths:
+        return max_window or FALLBACK_CONTEXT_WINDOW
+    if max_window is None:
+        return lengths[0]
+    return min(lengths[0], max_window)
+
+
+async def fit_context(conversation: Conversation, model: str = DEFAULT_MODEL) -> None:
+    """Keep a conversation within the model's token budget without any LLM call (summarization runs
+    in the background, see summarizer.py). Oversized messages are truncated, and if the context is still
+    over budget, the oldest messages are dropped.
+
+    Args:
+        conversation (Conversation): The conversation to fit.
+        model (str, optional): The model that will read the conversation. Defaults to DEFAULT_MODEL.
+
+    Returns: None
+    """
     if model is None:
         model = DEFAULT_MODEL
 
-    info = ollama_client._request_raw("POST", "/api/show",json={"name":model}).json()
-    capabilities = info["capabilities"]
-    return capabilities
+    budget = await context_window(model) - conf_module.load_conf('CONTEXT_RESERVE')
+    budget -= sum(entry_tokens(note) for note in conversation.notes)
+    if conversation.tokens <= budget:
+        return
+
+    # Shrink single messages taking too much of the budget (e.g. a whole uploaded file)
+    max_message = int(budget * conf_module.load_conf('MAX_MESSAGE_SHARE'))
+    messages = conversation.messages[:1] + [truncate_entry(m, max_message) for m in conversation.messages[1:]]
+    if any(new is not old for new, old in zip(messages, conversation.messages)):
+        conversation.replace(messages)
+
+    # Last resort: drop the oldest messages
+    if conversation.tokens > budget:
+        messages = list(conversation.messages)
+        counts = list(conversation.token_counts)
+        while len(messages) > 2 and sum(counts) > budget:
+            messages.pop(1)
+            counts.pop(1)
+        conversation.replace(messages)
 
 
-def summarize_chat(num: int = 10, model: str = DEFAULT_MODEL) -> None:
+async def summarize_chat(conversation: Conversation, num: int = 10, model: str = DEFAULT_MODEL) -> None:
     """Summarize the first `num` messages (after system prompt) and replace them with a summary.
+    A previous summary among them is extended rather than rebuilt. The conversation can keep growing
+    meanwhile: the summary is only swapped in if the summarized messages are still in place.
 
     Args:
+        conversation (Conversation): The conversation to summarize.
         num (int, optional): Number of messages to summarize. Defaults to 10.
         model (str, optional): The model to use for summarization. Defaults to DEFAULT_MODEL.
     
     Returns: None
     """
+    context = conversation.messages
+
     if len(context) <= num + 1:
         print("Not enough messages to summarize.")
         return
 
-    system_msg = context[0]
-
-    to_summarize = context[1:num+1]
-    keep_rest = context[num+1:]
-
-    summarization_prompt = (
-        "Summarize the following conversation in a concise but clear way."
-        "Keep important details, but remove fluff. Make it short enough to fit in one message.\n\n"
-        f"{json.dumps(to_summarize, ensure_ascii=False, indent=2)}"
-    )
-
-    response = ollama_client.chat(
+    summarized = context[1:num+1]
+
+    to_summarize = summarized
+    previous_summary = None
+    if summarized[0].get("role") == "system" and summarized[0].get("content", "").startswith(SUMMARY_PREFIX):
+        previous_summary = summarized[0]["content"][len(SUMMARY_PREFIX):]
+        to_summarize = summarized[1:]
+
+    if previous_summary:
+        summarization_prompt = (
+            "Here is the summary of the conversation so far:\n"
+            f"{previous_summary}\n\n"
+            "Update it with the following new messages, in a concise but clear way."
+            "Keep important details, but remove fluff. Make it short enough to fit in one message.\n\n"
+            f"{json.dumps(to_summarize, ensure_ascii=False, indent=2)}"
+        )
+    else:
+        summarization_prompt = (
+            "Summarize the following conversation in a concise but clear way."
+            "Keep important details, but remove fluff. Make it short enough to fit in one message.\n\n"
+            f"{json.dumps(to_summarize, ensure_ascii=False, indent=2)}"
+        )
+
+    response = await ollama_chat(
+        route=conversation.id,
         model=model,
         messages=[
             {"role": "system", "content": "You are a summarizer. Do not tell what you're about to do, summarize only."},
             {"role": "user", "content": summarization_prompt}
         ],
-        think=False
+        think=False,
+        options={'num_ctx': await context_window(model)}
     )
 
     summary_text = response["message"]["content"].strip()
@@ -187,20 +389,22 @@ def summarize_chat(num: int = 10, model: str = DEFAULT_MODEL) -> None:
     # Build new summarized context
     summarized_msg = {
         "role": "system",
-        "content": f"(Summary of earlier conversation)\n{summary_text}"
+        "content": f"{SUMMARY_PREFIX}{summary_text}"
     }
 
-    new_context = [system_msg, summarized_msg] + keep_rest
+    # Swap the summary in, unless the head of the conversation changed while summarizing
+    current = conversation.messages
+    if len(current) <= num or any(a is not b for a, b in zip(current[1:num+1], summarized)):
+        print("Conversation changed during summarization, summary dropped.")
+        return
 
-    context.clear()
-    context.extend(new_context)
+    new_context = [current[0], summarized_msg] + current[num+1:]
 
-    with open("context.json", "w", encoding="utf-8") as f:
-        json.dump(context, f, ensure_ascii=False, indent=2)
+    conversation.replace(new_context)
 
 
-def get_tool_call(tool_call) -> str:
-    """Run the proper tool called and output its result.
+async def get_tool_call(tool_call) -> str:
+    """Run the proper tool called and output its result. Blocking tools run in a worker thread.
 
     Args:
         tool_call (dict): The tool call structure from the model.
@@ -212,24 +416,24 @@ def get_tool_call(tool_call) -> str:
 
     if tool_name == 'browse':
         query = tool_call['function']['arguments'].get('query')
-        result = browse(str(query))
+        result = await asyncio.to_thread(browse, str(query))
         return(str(result))
 
     elif tool_name == 'gif':
         query = tool_call['function']['arguments'].get('query')
-        result = gif(str(query))
+        result = await asyncio.to_thread(gif, str(query))
         return(str(result))
 
     elif tool_name == "python":
         script = tool_call['function']['arguments'].get('script')
-        result = scripting.run_script(script)
+        result = await scripting.run_script(script)
         return(str(result))
     
     elif tool_name == "memorize":
         information = tool_call['function']['arguments'].get('information')
         info_user = tool_call['function']['arguments'].get('user')
         
-        write_memory(info_user, information)
+        await asyncio.to_thread(write_memory, info_user, information)
 
         result = f"Information about {info_user} saved: {information}"
         return(str(result))
@@ -239,11 +443,109 @@ def get_tool_call(tool_call) -> str:
         return(error_msg, 'tool')
 
 
-def save_context(content, role='user', image_path: list = None, custom_field: str = None) -> None:
+async def run_tool_calls(tool_calls: list) -> list:
+    """Run the tool calls of one model turn concurrently, each one within its tool's concurrency limit and timeout.
+
+    Args:
+        tool_calls (list): The tool call structures from the model.
+
+    Returns:
+        list: The result of each tool call, in call order.
     """
-    Save a message to the context and write it to context.json.
+    async def run(tool_call):
+        tool_name = tool_call['function'].get('name')
+        timeout = conf_module.load_conf('TOOL_TIMEOUTS').get(tool_name, conf_module.load_conf('TOOL_TIMEOUT'))
+        try:
+            async with tool_limits.hold(tool_name):
+                return await asyncio.wait_for(get_tool_call(tool_call), timeout)
+        except asyncio.TimeoutError:
+            return f"Error: {tool_name} took more than {timeout} seconds."
+        except Exception as e:
+            return f"Error: {e}"
+
+    return await asyncio.gather(*(run(tool_call) for tool_call in tool_calls))
+
+
+def encode_image(path: str) -> str:
+    """Get the base64 encoding of an image file, from memory if it was sent recently.
 
     Args:
+        path (str): Path to the image.
+
+    Returns:
+        str: The base64 image, or None if the file is gone.
+    """
+    encoded = encoded_images.get(path)
+    if encoded is not None:
+        encoded_images.move_to_end(path)
+        return encoded
+
+    try:
+        with open(path, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode()
+    except OSError:
+        return None
+
+    encoded_images[path] = encoded
+    while len(encoded_images) > conf_module.load_conf('IMAGE_MEMORY_CACHE'):
+        encoded_images.popitem(last=False)
+    return encoded
+
+
+async def build_messages(conversation: Conversation, model: str = DEFAULT_MODEL) -> list:
+    """Build the messages sent to the model: the conversation followed by its notes. Image paths are
+    replaced by their cached base64 encoding, and images are left out entirely for models without vision.
+
+    Args:
+        conversation (Conversation): The conversation to send.
+        model (str, optional): The model that will read it. Defaults to DEFAULT_MODEL.
+
+    Returns:
+        list: The request messages. Entries without images are shared with the conversation.
+    """
+    if not any(m.get('images') for m in conversation.messages):
+        return conversation.messages + conversation.notes
+
+    vision = "vision" in await get_model_capabilities(model)
+    messages = []
+    for entry in conversation.messages:
+        if entry.get('images'):
+            entry = dict(entry)
+            images = [encode_image(path) for path in entry.pop('images')] if vision else []
+            if any(images):
+                entry['images'] = [image for image in images if image]
+        messages.append(entry)
+    return messages + conversation.notes
+
+
+def drop_old_images(conversation: Conversation) -> None:
+    """Remove the images of older messages, keeping those of the last IMAGE_KEEP messages with images.
+    Old screenshots are rarely useful and each one costs hundreds of tokens on every request.
+
+    Args:
+        conversation (Conversation): The conversation to trim.
+
+    Returns: None
+    """
+    with_images = [i for i, m in enumerate(conversation.messages) if m.get('images')]
+    old = with_images[:max(0, len(with_images) - conf_module.load_conf('IMAGE_KEEP'))]
+    if not old:
+        return
+
+    messages = list(conversation.messages)
+    for i in old:
+        entry = {k: v for k, v in messages[i].items() if k != 'images'}
+        entry['content'] = f"{entry.get('content') or ''}{IMAGE_DROPPED_NOTE}"
+        messages[i] = entry
+    conversation.replace(messages)
+
+
+def save_context(conversation: Conversation, content, role='user', image_path: list = None, custom_field: str = None) -> None:
+    """
+    Save a message to the conversation and append it to its journal.
+
+    Args:
+        conversation (Conversation): The conversation to save the message to.
         content (str): The message content.
         role (str): The role of the message ('user', 'assistant', 'system', 'tool'). Defaults to 'user'.
         image_path (list, optional): List of image paths associated with the message. Defaults to None.
@@ -269,103 +571,195 @@ def save_context(content, role='user', image_path: list = None, custom_field: st
         except ValueError:
             raise ValueError("custom_field must be in format 'field, value'")
 
-    context.append(entry)
+    conversation.append(entry)
 
-    try:
-        data_str = json.dumps(context, ensure_ascii=False, indent=2)
-        json.loads(data_str)
-
-        path = "context.json"
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(data_str)
-
-    except Exception as e:
-        raise RuntimeError(f"Couldn't save context: {e}")
+    if image_path:
+        drop_old_images(conversation)
 
 
-def chat(content: str, role: str = 'user', model: str = DEFAULT_MODEL, thinking: str = 'auto', num_retry_fail: int = 5, custom_field: str = None, custom_tools: str = None) -> str:
+async def chat(conversation: Conversation, content: str, role: str = 'user', model: str = DEFAULT_MODEL, thinking: str = 'auto', num_retry_fail: int = None, custom_field: str = None, custom_tools: str = None, before_tools: asyncio.Event = None) -> str:
     """Generate a reply from the LLM with optional multimodal tool calling.
 
     Args:
+        conversation (Conversation): The conversation to reply in.
         content (str): The prompt given to the model.
         role (str, optional): The role to label the message with. 
             Options: 'user', 'assistant', 'system'. Defaults to 'user'.
         model (str, optional): The model to use for generation. Defaults to DEFAULT_MODEL.
         thinking (str, optional): Whether to enable tool calling.
             Options: 'auto', 'true', 'false'. Defaults to 'auto'.
-        num_retry_fail (int, optional): Number of retries on failure. Defaults to 5.
+        num_retry_fail (int, optional): Number of retries of each request on transient errors. Defaults to REQUEST_RETRIES.
         custom_field (str, optional): Extra field in format "field, value". Defaults to None.
         custom_tools (str, optional): Custom tool_call structure in JSON format. Defaults to None.
+        before_tools (asyncio.Event, optional): Wait for this event before running tools, so a speculative
+            generation has no side effects until it is confirmed. Defaults to None.
+
+    Raises:
+        Exception: Fatal request errors (e.g. unknown model).
 
     Returns:
-        str: The generated reply from the model.
+        str: The generated reply from the model, or an apology if Ollama kept failing until REQUEST_DEADLINE.
     """
-    if num_retry_fail >= 0:
-        try:
-            if model is None:
-                model = DEFAULT_MODEL
+    if model is None:
+        model = DEFAULT_MODEL
 
-            generate = True
+    # Shared by every request of this reply, tool rounds included
+    deadline = time.monotonic() + conf_module.load_conf('REQUEST_DEADLINE')
+
+    generate = True
+    tool_calling = False
+    final_output = ""
+
+    if custom_field:
+        save_context(conversation, content, role=role, custom_field=custom_field)
+    else:
+        save_context(conversation, content, role=role)
+
+    while generate:
+        if thinking.lower() == 'auto':
+            pass
+        elif thinking.lower() == 'true':
+            tool_calling = True
+        elif thinking.lower() == 'false':
             tool_calling = False
-            final_output = ""
 
-            if custom_field:
-                save_context(content, role=role, custom_field=custom_field)
+        messages = await build_messages(conversation, model)
+        try:
+            response = await ollama_chat(
+                route=conversation.id,
+                deadline=deadline,
+                retries=num_retry_fail,
+                model=model,
+                messages=messages,
+                tools=custom_tools or tools,
+                think=tool_calling,
+                stream=False,
+                options={'num_ctx': await context_window(model)},
+            )
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            print(f"[chat] Giving up after retries: {e!r}")
+            return RETRY_LATER
+
+        dump = response.model_dump(mode='json')
+        log_response(dump)
+        prompt_cache.record(dump, prompt_cache.prompt_tokens(messages))
+
+        if response['message'].get('content'):
+            final_output = response['message']['content']
+            save_context(conversation, final_output, 'assistant')
+            generate = False
+            tool_calling = False
+
+        elif 'tool_calls' in response['message']:
+            if custom_tools:
+                return(response['message']['tool_calls'])
             else:
-                save_context(content, role=role)
-
-            while generate:
-                if thinking.lower() == 'auto':
-                    pass
-                elif thinking.lower() == 'true':
-                    tool_calling = True
-                elif thinking.lower() == 'false':
-                    tool_calling = False
-
-                if custom_tools:
-                    response = ollama_client.chat(
-                        model=model,
-                        messages=context,
-                        tools=custom_tools,
-                        think=tool_calling,
-                        stream=False,
-                    )
-                else:
-                    response = ollama_client.chat(
-                        model=model,
-                        messages=context,
-                        tools=tools,
-                        think=tool_calling,
-                        stream=False,
-                    )
+                if before_tools is not None:
+                    await before_tools.wait()
+
+                for result in await run_tool_calls(response['message']['tool_calls']):
+                    save_context(conversation, result, 'tool')
+
+            generate = True
+            tool_calling = True
 
-                logs.append(response.model_dump(mode='json'))
+    return final_output
 
-                with open("logs.json", "w", encoding="utf-8") as f:
-                    json.dump(logs, f, ensure_ascii=False, indent=2)
+async def chat_stream(conversation: Conversation, content: str, role: str = 'user', model: str = DEFAULT_MODEL, thinking: str = 'auto', custom_field: str = None):
+    """Generate a reply from the LLM in streaming, running tool calls between generation rounds.
 
-                if response['message'].get('content'):
-                    final_output = response['message']['content']
-                    save_context(final_output, 'assistant')
-                    generate = False
-                    tool_calling = False
+    Args:
+        conversation (Conversation): The conversation to reply in.
+        content (str): The prompt given to the model.
+        role (str, optional): The role to label the message with.
+            Options: 'user', 'assistant', 'system'. Defaults to 'user'.
+        model (str, optional): The model to use for generation. Defaults to DEFAULT_MODEL.
+        thinking (str, optional): Whether to enable tool calling.
+            Options: 'auto', 'true', 'false'. Defaults to 'auto'.
+        custom_field (str, optional): Extra field in format "field, value". Defaults to None.
 
-                elif 'tool_calls' in response['message']:
-                    if custom_tools:
-                        return(response['message']['tool_calls'])
-                    else:
-                        for tool_call in response['message']['tool_calls']:
-                            result = get_tool_call(tool_call)
+    Raises:
+        Exception: Fatal request errors (e.g. unknown model).
 
-                            save_context(result, 'tool')
+    Yields:
+        str: Pieces of the reply, as soon as the model outputs them, or an apology if Ollama kept failing
+            until REQUEST_DEADLINE before the first piece.
+    """
+    if model is None:
+        model = DEFAULT_MODEL
 
-                    generate = True
-                    tool_calling = True
+    tool_calling = thinking.lower() == 'true'
+    deadline = time.monotonic() + conf_module.load_conf('REQUEST_DEADLINE')
 
-            return final_output
+    save_context(conversation, content, role=role, custom_field=custom_field)
 
-        except ResponseError as e:
-            if e.status_code == "524":
-                num_retry_fail -= 1
-    else:
-        return "couldn't generate the message. Please retry later."
\ No newline at end of file
+    while True:
+        attempt = 0
+        previous = None # Host of the failed attempt, a retry avoids it
+        while True:
+            final_output = ""
+            tool_calls = []
+            last = None
+            messages = await build_messages(conversation, model)
+
+            try:
+                async with pool.use(model, conversation.id, previous) as host, model_limits.hold((host.link, model)), host_limits.hold(host.link):
+                    previous = host
+                    # Each read gets REQUEST_ATTEMPT_TIMEOUT, within the deadline, so a stalled host can't hang the turn
+                    stream = await asyncio.wait_for(host.client.chat(
+                        model=model,
+                        messages=messages,
+                        tools=tools,
+                        think=tool_calling,
+                        stream=True,
+                        options={'num_ctx': await context_window(model)},
+                        keep_alive=conf_module.load_conf('KEEP_ALIVE'),
+                    ), attempt_timeout(deadline, conf_module.load_conf('REQUEST_ATTEMPT_TIMEOUT')))
+
+                    while True:
+                        try:
+                            part = await asyncio.wait_for(anext(stream), attempt_timeout(deadline, conf_module.load_conf('REQUEST_ATTEMPT_TIMEOUT')))
+                        except StopAsyncIteration:
+                            break
+                        last = part
+                        if part['message'].get('content'):
+                            final_output += part['message']['content']
+                            yield part['message']['content']
+                        if part['message'].get('tool_calls'):
+                            tool_calls.extend(part['message']['tool_calls'])
+                break
+
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                # Once pieces were sent the reply can't be restarted, keep what was sent
+                if final_output:
+                    print(f"[chat_stream] Reply cut short: {e!r}")
+                    break
+                delay = backoff(attempt, conf_module.load_conf('RETRY_BASE_DELAY'), conf_module.load_conf('RETRY_MAX_DELAY'))
+                if attempt >= conf_module.load_conf('REQUEST_RETRIES') or time.monotonic() + delay >= deadline:
+                    print(f"[chat_stream] Giving up after retries: {e!r}")
+                    yield RETRY_LATER
+                    return
+                print(f"[chat_stream] Attempt {attempt + 1} failed ({e!r}), retrying in {delay:.1f}s.")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+        if last is not None:
+            dump = last.model_dump(mode='json')
+            dump['message']['content'] = final_output
+            dump['message']['tool_calls'] = [t.model_dump(mode='json') for t in tool_calls] or None
+            log_response(dump)
+            prompt_cache.record(dump, prompt_cache.prompt_tokens(messages))
+
+        if final_output or not tool_calls:
+            save_context(conversation, final_output, 'assistant')
+            return
+
+        for result in await run_tool_calls(tool_calls):
+            save_context(conversation, result, 'tool')
+
+        if thinking.lower() != 'false':
+            tool_calling = True
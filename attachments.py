@@ -0,0 +1,267 @@
+"""
+attachments.py
+Attachment ingestion: concurrent downloads, CPU-bound processing in a process pool, results saved in order.
+Processed results are cached by content hash, so re-posted files are not parsed or transcribed again.
+"""
+import asyncio
+import contextlib
+import hashlib
+import os
+import tempfile
+
+import magic
+
+import conf_module
+import doc_index
+import load_file
+import transcription
+from conversation import Conversation
+from disk_cache import DiskCache
+from limiter import KeyedLimiter
+from Llm import DEFAULT_MODEL, get_model_capabilities, save_context
+from worker_pool import WorkerPool
+
+ATTACHMENT_FOLDER = conf_module.load_conf('ATTACHMENT_FOLDER')
+ATTACHMENT_WORKERS = conf_module.load_conf('ATTACHMENT_WORKERS')
+
+if not os.path.exists(ATTACHMENT_FOLDER):
+    os.makedirs(ATTACHMENT_FOLDER)
+
+# Max attachments of each type processed at once
+type_limits = KeyedLimiter(ATTACHMENT_WORKERS, conf_module.load_conf('ATTACHMENT_TYPE_LIMITS'))
+
+# Processed results (extracted text, transcription, normalized image) keyed by content hash
+cache = DiskCache(conf_module.load_conf('ATTACHMENT_CACHE_FILE'), max_bytes=conf_module.load_conf('ATTACHMENT_CACHE_BYTES'))
+
+# Image conversion and document parsing, a job past ATTACHMENT_TIMEOUT restarts the workers
+workers = WorkerPool(ATTACHMENT_WORKERS, name="attachments")
+
+_inflight = {} # cache key -> task processing it, shared by identical concurrent uploads
+_processing = set() # Raw uploads being processed, never evicted
+
+def file_kind(data: bytes) -> str:
+    """
+    Detect how a file should be processed from its first bytes.
+
+    Args:
+        data (bytes): The start of the file.
+
+    Returns:
+        str: "image", "audio" or "document".
+    """
+    mime_type = magic.from_buffer(data, mime=True)
+    if mime_type.startswith("image"):
+        return "image"
+    if mime_type.startswith("audio"):
+        return "audio"
+    return "document"
+
+def _write(filepath: str, data: bytes) -> None:
+    """
+    Write a file atomically, unless it already exists. Paths are content hashes, so an existing file has the same content,
+    it is only marked as recently used.
+
+    Args:
+        filepath (str): Destination path.
+        data (bytes): File content.
+
+    Returns: None
+    """
+    if os.path.exists(filepath):
+        with contextlib.suppress(OSError):
+            os.utime(filepath)
+        return
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+def _write_upload(data: bytes, ext: str) -> str:
+    """
+    Write a raw upload to a unique file for processing. It is deleted by `_remove_upload` once processed.
+
+    Args:
+        data (bytes): File content.
+        ext (str): File extension, load_file picks the parser from it.
+
+    Returns:
+        str: The file path.
+    """
+    fd, filepath = tempfile.mkstemp(dir=os.path.abspath(ATTACHMENT_FOLDER), prefix="upload-", suffix=ext)
+    _processing.add(filepath)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return filepath
+
+def _remove_upload(filepath: str) -> None:
+    """
+    Delete a processed raw upload.
+
+    Args:
+        filepath (str): The file path.
+
+    Returns: None
+    """
+    with contextlib.suppress(OSError):
+        os.remove(filepath)
+    _processing.discard(filepath)
+
+def _evict() -> None:
+    """
+    Delete the least recently used files of ATTACHMENT_FOLDER until it fits in ATTACHMENT_FOLDER_BYTES.
+    Images sent to the model are read from there, an evicted image is left out of the request.
+
+    Returns: None
+    """
+    files = []
+    for entry in os.scandir(ATTACHMENT_FOLDER):
+        if entry.is_file() and os.path.abspath(entry.path) not in _processing:
+            with contextlib.suppress(OSError):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    excess = sum(size for _, size, _ in files) - conf_module.load_conf('ATTACHMENT_FOLDER_BYTES')
+    for _, size, path in sorted(files):
+        if excess <= 0:
+            break
+        with contextlib.suppress(OSError):
+            os.remove(path)
+            excess -= size
+
+async def _cached(key: str, compute) -> bytes:
+    """
+    Get a processed result from the cache, or compute and cache it.
+    Identical attachments processed at the same time share one computation.
+
+    Args:
+        key (str): The cache key.
+        compute (callable): Coroutine function returning the result bytes.
+
+    Returns:
+        bytes: The processed result.
+    """
+    value = await asyncio.to_thread(cache.get, key)
+    if value is not None:
+        return value
+
+    task = _inflight.get(key)
+    if task is None:
+        async def run():
+            value = await compute()
+            await asyncio.to_thread(cache.set, key, value)
+            return value
+
+        task = asyncio.ensure_future(run())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+async def process(attachment, user, conversation_id: str) -> dict:
+    """
+    Download and process one attachment. Large documents are indexed for retrieval instead of being pasted in the context.
+
+    Args:
+        attachment (discord.Attachment): The attachment.
+        user (discord.User): User who uploaded the file.
+        conversation_id (str): The conversation the file was sent in.
+
+    Returns:
+        dict: The save_context arguments (content, and image_path for images), or None if it couldn't be processed.
+    """
+    max_bytes = conf_module.load_conf('ATTACHMENT_MAX_BYTES')
+    if attachment.size > max_bytes:
+        return {'content': f"File {attachment.filename} uploaded by {user} is too large to be read ({attachment.size} bytes)."}
+
+    try:
+        # Don't download images the model can't see
+        if (attachment.content_type or "").startswith("image") and "vision" not in await get_model_capabilities(DEFAULT_MODEL):
+            return {'content': f"Image uploaded by {user} (you can't see images)."}
+
+        data = await attachment.read()
+        digest = hashlib.sha256(data).hexdigest()
+        kind = file_kind(data[:4096])
+        ext = os.path.splitext(attachment.filename)[1].lower()
+        timeout = conf_module.load_conf('ATTACHMENT_TIMEOUT')
+        max_side = conf_module.load_conf('IMAGE_MAX_SIDE')
+        quality = conf_module.load_conf('IMAGE_QUALITY')
+        budgets = (conf_module.load_conf('FILE_MAX_CHARS'), conf_module.load_conf('FILE_MAX_PAGES'), conf_module.load_conf('FILE_MAX_BYTES'))
+
+        async def compute() -> bytes:
+            # The raw upload is only kept while it is processed
+            filepath = await asyncio.to_thread(_write_upload, data, ext)
+            try:
+                return await process_file(filepath)
+            finally:
+                await asyncio.to_thread(_remove_upload, filepath)
+
+        async def process_file(filepath: str) -> bytes:
+            async with type_limits.hold(kind):
+                # If image, downscale and compress for vision models
+                if kind == "image":
+                    return await workers.run(load_file.normalize_image, filepath, max_side, quality, timeout=timeout)
+
+                # If audio, use whisper to transcribe
+                elif kind == "audio":
+                    text = await transcription.transcribe(filepath, timeout)
+                    return text.encode("utf-8")
+
+                # If text-based file, load content
+                else:
+                    text = await workers.run(load_file.load_file, filepath, *budgets, timeout=timeout)
+                    return text.encode("utf-8")
+
+        # Transcriptions depend on the Whisper model, images on the normalization settings, texts on the budgets
+        if kind == "audio":
+            variant = f"{transcription.WHISPER_MODEL_SIZE}:"
+        elif kind == "image":
+            variant = f"{max_side}:{quality}:"
+        else:
+            variant = ":".join(map(str, budgets)) + ":"
+        result = await _cached(f"{kind}:{variant}{digest}", compute)
+
+        if kind == "image":
+            # The normalized image may have been evicted from the folder since it was cached
+            image_path = os.path.abspath(os.path.join(ATTACHMENT_FOLDER, f"{digest}.{max_side}q{quality}.jpg"))
+            await asyncio.to_thread(_write, image_path, result)
+            await asyncio.to_thread(_evict)
+            return {'content': f"Image uploaded by {user}.", 'image_path': [image_path]}
+        elif kind == "audio":
+            return {'content': f"Audio file uploaded by {user}. Transcription: {result.decode('utf-8')}"}
+
+        text = result.decode('utf-8')
+        if len(text) <= conf_module.load_conf('DOC_INLINE_CHARS'):
+            return {'content': f"File uploaded by {user}:\n{text}"}
+
+        chunks = await asyncio.to_thread(doc_index.index_document, conversation_id, digest, attachment.filename, text)
+        preview = text[:conf_module.load_conf('DOC_PREVIEW_CHARS')].strip()
+        return {'content': (
+            f"File {attachment.filename} uploaded by {user} ({len(text)} characters, {chunks} parts indexed). "
+            f"The parts relevant to each message will be shown to you. Beginning of the file:\n{preview}"
+        )}
+
+    except asyncio.TimeoutError:
+        return {'content': f"File {attachment.filename} uploaded by {user} took too long to be read."}
+    except Exception as e:
+        print(f"[attachments] Couldn't process {attachment.filename}: {e}")
+        return None
+
+async def ingest(conversation: Conversation, uploads: list) -> None:
+    """
+    Process attachments concurrently and save the results to the conversation in upload order.
+
+    Args:
+        conversation (Conversation): The conversation the files were sent in.
+        uploads (list): (discord.Attachment, uploader) pairs.
+
+    Returns: None
+    """
+    results = await asyncio.gather(*(process(attachment, user, conversation.id) for attachment, user in uploads))
+    for result in results:
+        if result:
+            save_context(conversation, result['content'], 'user', image_path=result.get('image_path'))
@@ -0,0 +1,423 @@
+"""
+bot.py
+The discord bot: handles messages, attachments, reactions...
+"""
+import time
+import asyncio
+
+import discord
+from discord import app_commands
+
+from Llm import chat, chat_stream, fit_context, save_context, load
+import attachments
+import conf_module
+import doc_index
+from ollama_pool import pool
+from conversation import Conversation, ConversationStore
+from discord_reply import split_message, stream_reply
+from limiter import SpeculationBudget
+from scheduler import Turn, TurnScheduler
+import prompt_cache
+import reply_gate
+import scripting
+import summarizer
+import transcription
+from rag_embedding import read_memory
+
+speculation_budget = SpeculationBudget(
+    conf_module.load_conf('SPECULATIVE_MAX_INFLIGHT'),
+    conf_module.load_conf('SPECULATIVE_MAX_WASTED')
+)
+
+def on_config_reload(changed: dict) -> None:
+    """
+    Report configuration changes picked up without a restart.
+
+    Args:
+        changed (dict): The changed variables and their new values.
+
+    Returns: None
+    """
+    print(f"Configuration reloaded: {', '.join(changed)}")
+
+conf_module.subscribe(on_config_reload)
+
+conversations = ConversationStore(
+    conf_module.load_conf('CONVERSATIONS_FOLDER'),
+    max_conversations=conf_module.load_conf('MAX_CONVERSATIONS'),
+    max_size=conf_module.load_conf('MAX_CONVERSATIONS_SIZE'),
+    compact_every=conf_module.load_conf('CONTEXT_COMPACT_EVERY')
+)
+
+def system_prompt(channel) -> dict:
+    """
+    Build the system message of a channel's conversation.
+
+    Args:
+        channel (discord.abc.Messageable): The channel the conversation happens in.
+
+    Returns:
+        dict: The system message, with the channel description appended to SYSTEM_PROMPT.
+    """
+    channel_name = channel.name if hasattr(channel, 'name') else "Direct Message"
+    channel_desc = channel.topic if getattr(channel, 'topic', None) else "No description"
+    guild = getattr(channel, 'guild', None)
+
+    if guild:
+        location = f"You're in {guild.name}, {channel_name} channel. Description: {channel_desc}"
+    else:
+        location = f"You're in {channel_name} channel. Description: {channel_desc}"
+
+    return {
+        'role': 'system',
+        'content': f"{conf_module.load_conf('SYSTEM_PROMPT')}\n{location}"
+    }
+
+async def get_conversation(channel) -> Conversation:
+    """
+    Get the conversation of a channel, restoring it from disk if needed.
+
+    Args:
+        channel (discord.abc.Messageable): The channel (guild channel or DM).
+
+    Returns:
+        Conversation: The channel's conversation.
+    """
+    conversation = await conversations.get(channel.id, initial=[system_prompt(channel)])
+    if conversation.resumed:
+        conversation.resumed = False
+        await fetch_previous_chat(conversation) # Get the time since last connection
+    return conversation
+
+def format_elapsed(seconds: float) -> str:
+    """
+    Format elapsed time in a human-readable way.
+
+    Args:
+        seconds (float): The elapsed time in seconds.
+
+    Returns:
+        str: The formatted elapsed time.
+    """
+    minutes, sec = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    parts = []
+    if days: parts.append(f"{days} day{'s' if days != 1 else ''}")
+    if hours: parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
+    if minutes: parts.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
+    if sec: parts.append(f"{sec} second{'s' if sec != 1 else ''}")
+    return ", ".join(parts) if parts else "0 seconds"
+
+async def fetch_previous_chat(conversation: Conversation) -> None:
+    """
+    Tell a conversation restored from disk how long the bot was disconnected.
+
+    Args:
+        conversation (Conversation): The restored conversation.
+
+    Returns: None
+    """
+    last_write = await asyncio.to_thread(conversation.journal.last_write_time)
+    if last_write:
+        elapsed = time.time() - last_write
+
+        last_msg = conversation.messages[-1]
+        if (
+            last_msg.get("role") == "system"
+            and last_msg.get("content", "").startswith("You've been disconnected")
+        ):
+            conversation.replace(conversation.messages[:-1])
+
+        save_context(conversation, f"You've been disconnected for {format_elapsed(elapsed)}", 'system')
+
+intents = discord.Intents.default()
+intents.messages = True
+intents.reactions = True
+intents.members = True
+intents.message_content = True
+client = discord.Client(intents=intents)
+tree = app_commands.CommandTree(client)
+
+# On bot ready
+@client.event
+async def on_ready():
+    pool.start() # health checks of the Ollama hosts
+    if conf_module.load_conf('WHISPER_PRELOAD'):
+        transcription.start(preload=True) # load Whisper in the background
+    scripting.start() # start the python tool workers
+    if conf_module.load_conf('LOAD_MODEL_ON_START'):
+        try:
+            await load() # load Llm
+        except Exception as e: # Not fatal, the model loads on the first message
+            print(f"Couldn't load the model: {e!r}")
+    print(f"Logged in as {client.user}")
+
+# On reacted message
+@client.event
+async def on_reaction_add(reaction, user):
+    if user == client.user:
+        return
+
+    conversation = await get_conversation(reaction.message.channel)
+
+    # Wait for the running turn, so the reaction isn't saved between a prompt and its reply
+    async with conversation.lock:
+        save_context(conversation, f"{user} reacted with {reaction.emoji} to message: {reaction.message.content}", role="system")
+
+# Process each message with Llm
+@client.event
+async def on_message(msg):
+    if msg.guild:
+        reply_gate.observe(msg)
+
+    # Ignore messages conditions
+    if msg.author == client.user or msg.content.startswith('/silent'):
+        return
+
+    # Settle obvious cases locally, the MPCA only decides the ambiguous ones
+    if msg.guild == None: # Direct message: must always reply (LLM/GPT like)
+        gate, urgent = True, True
+    else:
+        gate = reply_gate.decide(msg, client.user)
+        urgent = reply_gate.addresses_bot(msg, client.user)
+
+    # Bursts of messages are answered in one turn
+    scheduler.submit(msg, gate, urgent)
+
+async def handle_turn(turn: Turn) -> None:
+    """
+    Run a turn of a channel in its conversation.
+
+    Args:
+        turn (Turn): The messages to handle.
+
+    Returns: None
+    """
+    conversation = await get_conversation(turn.messages[-1].channel)
+
+    # Turns of one channel are handled in order, other channels run concurrently
+    async with conversation.lock:
+        await handle_message(turn, conversation)
+
+    # Summarize in the background when the conversation gets long or goes idle
+    await summarizer.schedule(conversation)
+
+scheduler = TurnScheduler(
+    handle_turn,
+    slots=conf_module.load_conf('TURN_SLOTS'),
+    min_delay=conf_module.load_conf('COALESCE_MIN_DELAY'),
+    max_delay=conf_module.load_conf('COALESCE_MAX_DELAY'),
+    max_wait=conf_module.load_conf('COALESCE_MAX_WAIT')
+)
+
+async def handle_message(turn: Turn, conversation: Conversation) -> None:
+    """
+    Process the messages of a turn in their conversation and send one reply if the bot should answer.
+
+    Args:
+        turn (Turn): The messages to handle, oldest first.
+        conversation (Conversation): The channel's conversation, locked by the caller.
+
+    Returns: None
+    """
+    msg = turn.messages[-1]
+    authors = list(dict.fromkeys(str(m.author) for m in turn.messages))
+
+    # Reset system prompt just in case
+    conversation.set_system(system_prompt(msg.channel))
+    conversation.notes = []
+
+    # Append memory from RAG if new user
+    for author in authors:
+        if all('user' not in x or author not in x['user'] for x in conversation.messages):
+            query = " ".join(m.content for m in turn.messages if str(m.author) == author)
+            memory = await asyncio.to_thread(read_memory, 5, author, query)
+            if memory:
+                save_context(conversation, f"(Remembered from past conversations) {memory}", 'system')
+
+    contents = []
+    lines = []
+    uploads = []
+    replies = []
+    for m in turn.messages:
+        content = m.content
+
+        # Replace mentions with usernames, usefull for Llm understanding
+        if m.mentions:
+            for user in m.mentions:
+                content = content.replace(f"<@{user.id}>", f"@{user.name}")
+        contents.append(content)
+        # A cancelled turn may have saved its prompt already, this turn only answers it
+        if m.id not in turn.in_context:
+            lines.append(f"{m.created_at.astimezone().strftime("%H:%M")} - {m.author}: {content}")
+
+        # A cancelled turn may have saved these already
+        if m.id in turn.ingested:
+            continue
+
+        # handle attachments, and those of the replied message
+        uploads += [(attachment, m.author) for attachment in m.attachments]
+        if m.reference:
+            replied_message = await m.channel.fetch_message(m.reference.message_id)
+            uploads += [(attachment, replied_message.author) for attachment in replied_message.attachments]
+            replies.append(f"{m.author} replied to a message by {replied_message.author}: {replied_message.content}")
+
+    # All the files of the turn are processed at once
+    if uploads:
+        await attachments.ingest(conversation, uploads)
+    for reply in replies:
+        save_context(conversation, reply)
+    turn.ingested.update(m.id for m in turn.messages)
+
+    content = "\n".join(contents)
+    prompt = "\n".join(lines)
+
+    # Show the parts of previously uploaded large files relevant to this turn
+    relevant = await asyncio.to_thread(doc_index.search, conversation.id, content, conf_module.load_conf('DOC_TOP_K'))
+    if relevant:
+        parts = "\n\n".join(f"[{filename}]\n{chunk}" for filename, chunk in relevant)
+        conversation.notes = [{'role': 'system', 'content': f"(Relevant parts of uploaded files)\n{parts}"}]
+
+    # Trim chat if it still doesn't fit in the model's context (summaries run in the background)
+    await fit_context(conversation)
+
+    if any(gate == True for gate in turn.gates):
+        await reply_to(turn, conversation, prompt, authors)
+
+    elif any(gate is None for gate in turn.gates): # Ambiguous server messages
+        speculate = conf_module.load_conf('SPECULATIVE_REPLY')
+        if speculate and speculation_budget.try_acquire():
+            await speculative_reply(turn, conversation, prompt, authors)
+            return
+
+        if await mpca_decide(conversation, prompt):
+            await reply_to(turn, conversation, prompt, authors)
+
+async def mpca_decide(conversation: Conversation, prompt: str) -> bool:
+    """
+    Ask the Multi-Party Conversation Agent if the bot should reply.
+
+    Args:
+        conversation (Conversation): The channel's conversation.
+        prompt (str): The formatted user message.
+
+    Returns:
+        bool: The MPCA 'Action'.
+    """
+    # Simulate real conversation flow, in a throwaway conversation that is never persisted.
+    # The system prompt is constant and the transcript only grows, so Ollama reuses the cached prefix of the last decision
+    mpca_conversation = Conversation(f"mpca-{conversation.id}", [{
+            'role': 'system',
+            'content': "You're a Multi-Party Conversation Agent. Decide if you should reply to the user or not based on the conversation context. Always reply using tool_calls with the proper JSON structure: State_of_Mind, Semantic Understanding, Agent Action Modeling, and Action."
+        },
+        {
+            'role': 'user',
+            'content': prompt_cache.transcript(conversation.messages[1:])
+        }])
+
+    mpca_reply = await chat(mpca_conversation, prompt, thinking = 'False', custom_tools=conf_module.load_conf('MPCA'))
+
+    action = False
+    if isinstance(mpca_reply, list): # The model may answer with text instead of a tool call
+        for tools in mpca_reply:
+            action = tools['function']['arguments'].get('Action')
+    return action == True
+
+async def speculative_reply(turn: Turn, conversation: Conversation, prompt: str, authors: list) -> None:
+    """
+    Generate the reply on a fork of the conversation while the MPCA decides,
+    then send and commit it if the MPCA says to reply, or cancel it otherwise.
+    The caller must have acquired a slot from `speculation_budget`.
+
+    Args:
+        turn (Turn): The messages to reply to.
+        conversation (Conversation): The channel's conversation.
+        prompt (str): The formatted user messages.
+        authors (list): The names of the messages' authors.
+
+    Returns: None
+    """
+    msg = turn.messages[-1]
+    fork = conversation.fork()
+    confirmed = asyncio.Event() # Tools only run once the reply is confirmed
+    generation = asyncio.create_task(
+        chat(fork, prompt, custom_field=f'user, {", ".join(authors)}', before_tools=confirmed)
+    )
+
+    wasted = True
+    try:
+        if not await mpca_decide(conversation, prompt):
+            return
+
+        wasted = False
+        confirmed.set()
+        async with msg.channel.typing():
+            reply = await generation
+    finally:
+        if not generation.done():
+            generation.cancel()
+        speculation_budget.release(wasted)
+
+    turn.saved = turn.sending = True
+    conversation.commit(fork)
+    await send_reply(msg.channel, reply)
+
+async def reply_to(turn: Turn, conversation: Conversation, prompt: str, authors: list) -> None:
+    """
+    Generate the reply to a turn and send it, streamed if STREAM_REPLIES is enabled.
+    Until the reply starts being sent, newer messages cancel it (the prompt stays in the conversation).
+
+    Args:
+        turn (Turn): The messages to reply to.
+        conversation (Conversation): The channel's conversation.
+        prompt (str): The formatted user messages.
+        authors (list): The names of the messages' authors.
+
+    Returns: None
+    """
+    channel = turn.messages[-1].channel
+    custom_field = f'user, {", ".join(authors)}'
+
+    async with channel.typing():
+        # chat and chat_stream save the prompt before their first await
+        turn.saved = True
+        if conf_module.load_conf('STREAM_REPLIES'):
+            async def pieces():
+                async for piece in chat_stream(conversation, prompt, custom_field=custom_field):
+                    turn.sending = True
+                    yield piece
+
+            await stream_reply(channel, pieces(), conf_module.load_conf('STREAM_EDIT_INTERVAL'))
+            return
+
+        reply = await chat(conversation, prompt, custom_field=custom_field)
+
+    turn.sending = True
+    await send_reply(channel, reply)
+
+async def send_reply(channel, reply: str) -> None:
+    """
+    Send a reply, split to fit the Discord message limit.
+
+    Args:
+        channel (discord.abc.Messageable): Where to send the reply.
+        reply (str): The reply.
+
+    Returns: None
+    """
+    # length check for discord message limit
+    if len(reply) > 2000:
+        message_chunks = split_message(reply, max_length=2000)
+        for chunk in message_chunks:
+            await channel.send(chunk)
+    else:
+        await channel.send(reply)
+
+def run() -> None:
+    """
+    Run the bot until it is stopped.
+
+    Returns: None
+    """
+    client.run(conf_module.load_conf('DISCORD_TOKEN'))
\ No newline at end of file
@@ -1,10 +1,104 @@
 """
 conf_module.py
-Configuration loader module
+Configuration loader module, parsed once and hot reloaded when the file changes
 """
 import importlib.util
+import os
+import threading
+import time
 from pathlib import Path
 
+CHECK_INTERVAL = 1.0 # Min seconds between two checks of the config file mtime
+
+_configs = {} # path -> [module, mtime, last check time]
+_subscribers = []
+_lock = threading.Lock()
+
+def subscribe(callback) -> None:
+    """
+    Register a function called after each reload of the configuration.
+
+    Args:
+        callback (callable): Called with a dict of the changed variables and their new values.
+
+    Returns: None
+    """
+    _subscribers.append(callback)
+
+def _parse(path: Path):
+    """
+    Execute a configuration file into a new module object.
+
+    Args:
+        path (Path): Path to the configuration file.
+
+    Returns:
+        module: The parsed configuration.
+    """
+    spec = importlib.util.spec_from_file_location("config", path)
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    return conf
+
+def _values(conf) -> dict:
+    """
+    Get the variables defined by a configuration module.
+
+    Args:
+        conf (module): The parsed configuration.
+
+    Returns:
+        dict: The public variables.
+    """
+    return {k: v for k, v in conf.__dict__.items() if not k.startswith("__")}
+
+def get_conf(path="config.py"):
+    """
+    Get the parsed configuration, reparsing it only if the file changed.
+    The file mtime is checked at most every CHECK_INTERVAL seconds.
+
+    Args:
+        path (str): Path to the configuration file.
+
+    Returns:
+        module: The parsed configuration.
+    """
+    entry = _configs.get(path)
+    now = time.monotonic()
+    if entry is not None and now - entry[2] < CHECK_INTERVAL:
+        return entry[0]
+
+    with _lock:
+        entry = _configs.get(path)
+        mtime = os.stat(path).st_mtime_ns
+        if entry is not None and entry[1] == mtime:
+            entry[2] = now
+            return entry[0]
+
+        try:
+            conf = _parse(Path(path))
+        except Exception as e:
+            if entry is None:
+                raise
+            # Keep the last valid configuration while the file is being edited
+            print(f"[conf_module] Couldn't reload {path}: {e}")
+            entry[1], entry[2] = mtime, now
+            return entry[0]
+
+        # Swap the whole module at once, readers never see a half loaded configuration
+        _configs[path] = [conf, mtime, now]
+
+    if entry is not None:
+        old, new = _values(entry[0]), _values(conf)
+        changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+        if changed:
+            for callback in list(_subscribers):
+                try:
+                    callback(changed)
+                except Exception as e:
+                    print(f"[conf_module] Subscriber failed: {e}")
+    return conf
+
 def load_conf(varname=None, path="config.py") -> str:
     """
     Load configuration from a Python file.
@@ -12,14 +106,11 @@ def load_conf(varname=None, path="config.py") -> str:
     Args:
         varname (str, optional): Specific variable name to retrieve. If None, returns all variables.
         path (str): Path to the configuration file.
-    
+
     Returns:
         str: The value of the specified variable or a formatted string of all variables.
     """
-    path = Path(path)
-    spec = importlib.util.spec_from_file_location("config", path)
-    conf = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(conf)
+    conf = get_conf(path)
 
     if varname is not None:
         return getattr(conf, varname)
@@ -46,4 +137,4 @@ def load_conf(varname=None, path="config.py") -> str:
                 result_lines.append(format_value(v, 2))
             else:
                 result_lines.append(f"{k}: {v}")
-    return "\n".join(result_lines)
\ No newline at end of file
+    return "\n".join(result_lines)
@@ -43,19 +43,121 @@ Keep replies authentic to a natural assistant who is present in the community, f
 LINK = "https://localhost:11434" # Ollama server link
 DEFAULT_MODEL = "qwen3:8b" # Model to use
 EMBED_MODEL = "paraphrase-multilingual" # Embed model for RAG
+MEMORY_DB_FOLDER = "memory_db" # Folder of the persistent RAG memory index
+EMBED_BATCH_SIZE = 64 # Max texts sent in one embed request
+EMBED_CACHE_FILE = "embed_cache.db" # Persistent embedding cache
+EMBED_CACHE_SIZE = 50000 # Max cached embeddings before evicting the least recently used
 WHISPER_MODEL_SIZE = "tiny"  # Whisper model for audio transcription: tiny, base, small, medium, large
 USE_GPU = True  # Use GPU for Whisper if available
+WHISPER_PRELOAD = True  # Load Whisper when the bot starts instead of on the first audio file
+WHISPER_WORKERS = 1  # Worker processes running Whisper (each one holds a copy of the model)
+WHISPER_QUEUE_SIZE = 8  # Max audio files waiting or being transcribed, extra ones are refused
+MAX_CONCURRENT_PER_MODEL = 2  # Max parallel requests sent for one model
+MAX_CONCURRENT_PER_HOST = 4  # Max parallel requests sent to one Ollama host
+OLLAMA_HOSTS = []  # Ollama server links to spread requests over, LINK alone if empty
+POOL_CHECK_INTERVAL = 10  # Seconds between two health checks (and loaded models refresh) of each host
+POOL_MAX_FAILURES = 3  # Consecutive failures before a host is ejected
+POOL_EJECT_TIME = 30  # Seconds an ejected host is left alone before being tried again
+POOL_STICKY_SLACK = 2  # Extra in-flight requests tolerated on a conversation's host before it moves to another
+REQUEST_DEADLINE = 300  # Max seconds to produce a reply, retries and tool rounds included
+REQUEST_RETRIES = 4  # Retries of a request failing with a transient error (connection, timeout, 5xx, 429)
+REQUEST_ATTEMPT_TIMEOUT = 120  # Max seconds an attempt waits for a reply (or for the next streamed piece) before retrying
+RETRY_BASE_DELAY = 0.5  # Backoff delay scale in seconds, doubled at each retry (with random jitter)
+RETRY_MAX_DELAY = 10  # Max backoff delay in seconds
+HEDGE_REQUESTS = False  # Duplicate slow requests on another host (needs several OLLAMA_HOSTS, costs extra GPU time)
+HEDGE_PERCENTILE = 0.95  # A request is slow once it takes longer than this percentile of recent ones
+HEDGE_MIN_SAMPLES = 20  # Requests measured per model before hedging starts
+KEEP_ALIVE = "30m"  # Sent with every request: how long Ollama keeps the model, and the cached prompt prefixes, in memory (-1: forever)
 
 # - - - Client settings - - -
 ATTACHMENT_FOLDER = "attachments" # Folder to save attachments
-MAX_LENGTH = 40  # Max length of context before summarization (in messages)
+ATTACHMENT_MAX_BYTES = 25 * 1024 * 1024  # Attachments bigger than this are not downloaded
+ATTACHMENT_TIMEOUT = 120  # Max seconds spent processing one attachment
+ATTACHMENT_WORKERS = 2  # Worker processes for image conversion and document parsing
+ATTACHMENT_TYPE_LIMITS = {"image": 4, "document": 2, "audio": 2}  # Max attachments of each type processed at once
+ATTACHMENT_CACHE_FILE = "attachment_cache.db"  # Processed attachments (text, transcriptions, images) by content hash
+ATTACHMENT_CACHE_BYTES = 500 * 1024 * 1024  # Max size of the attachment cache before evicting the least recently used
+ATTACHMENT_FOLDER_BYTES = 200 * 1024 * 1024  # Max size of the images kept in ATTACHMENT_FOLDER for the model, least recently used are deleted
+IMAGE_MAX_SIDE = 1024  # Images are downscaled so their longest side fits, vision encoders don't use more
+IMAGE_QUALITY = 85  # Jpeg quality of the images sent to the model
+IMAGE_KEEP = 2  # Only the last N messages with images keep them, older images are dropped from the context
+IMAGE_MEMORY_CACHE = 16  # Encoded images kept in memory
+DOC_INLINE_CHARS = 4000  # Files up to this length are pasted in the context, longer ones are indexed and retrieved by parts
+DOC_CHUNK_SIZE = 1000  # Characters per indexed part of a file
+DOC_CHUNK_OVERLAP = 150  # Characters shared by consecutive parts
+DOC_TOP_K = 4  # Parts of uploaded files shown to the model for each message
+DOC_PREVIEW_CHARS = 500  # Beginning of a large file kept in the context as its summary
+FILE_MAX_CHARS = 200_000  # Text extraction of an uploaded file stops after this many characters
+FILE_MAX_PAGES = 100  # Max pdf pages read
+FILE_MAX_BYTES = 10 * 1024 * 1024  # Max bytes of plain text files read
+CONTEXT_COMPACT_EVERY = 200  # Rewrite a conversation snapshot after this many journaled messages
+CONVERSATIONS_FOLDER = "conversations"  # Folder holding the context of each channel/DM
+MAX_CONVERSATIONS = 20  # Max conversations kept in memory before evicting idle ones to disk
+MAX_CONVERSATIONS_SIZE = 5_000_000  # Max total size (in characters) of the conversations kept in memory
 HOST_OPTIMIZATIONS = True  # Enable optimizations for localhost
 LOAD_MODEL_ON_START = True  # Load the model when the bot starts
+STREAM_REPLIES = True  # Show replies while they are generated (edits the message as tokens arrive)
+STREAM_EDIT_INTERVAL = 1.0  # Min seconds between two edits of a streamed message (Discord rate limits)
+COALESCE_MIN_DELAY = 0.3  # Seconds to wait for more messages before answering a DM or a message addressed to the bot
+COALESCE_MAX_DELAY = 3  # Max seconds to wait for more messages, the wait adapts to how fast people are typing
+COALESCE_MAX_WAIT = 8  # Max seconds a message can be held back by a burst of newer ones
+TURN_SLOTS = 4  # Max turns handled at once across all channels, DMs and mentions go first
+
+# - - - Context settings - - -
+# Context sizes are in tokens, estimated from the message length
+CONTEXT_WINDOW = 8192  # Max context size requested from Ollama (capped by the model's own; None for the model's)
+CONTEXT_RESERVE = 1024  # Tokens kept free for the reply
+SUMMARIZE_AT = 0.8  # Summarize in the background once the context uses this share of the budget...
+SUMMARIZE_TO = 0.5  # ...down to this share of the budget
+SUMMARY_IDLE_DELAY = 120  # Also summarize contexts over SUMMARIZE_TO after this many idle seconds
+MAX_MESSAGE_SHARE = 0.25  # Truncate single messages (e.g. uploaded files) bigger than this share of the budget
+
+# - - - Logging settings - - -
+LOG_FILE = "logs.jsonl"  # Model responses log, one JSON object per line
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate the log once it reaches this size (0 to disable)
+LOG_MAX_AGE = 24 * 60 * 60  # Rotate the log once it is older than this many seconds (0 to disable)
+LOG_BACKUP_COUNT = 5  # Number of rotated log files to keep
+LOG_COMPRESS = True  # Gzip rotated log files
+LOG_RING_SIZE = 50  # Number of recent responses kept in memory for debugging
 
 # - - - Token settings - - -
 DISCORD_TOKEN = ""
 GIF_TOKEN = ""
 
+# - - - Reply gate settings - - -
+# Obvious reply decisions in servers are settled locally, only ambiguous messages go to the MPCA
+BOT_NAMES = []  # Extra names the bot answers to (its Discord name is always included)
+GATE_EXCHANGE_LENGTH = 4  # Skip messages when this many recent messages alternate between two other users...
+GATE_EXCHANGE_WINDOW = 60  # ...within this many seconds
+
+# - - - Web settings - - -
+WEB_POOL_SIZE = 8  # Pooled connections and concurrent page downloads
+WEB_CACHE_TTL = 600  # Seconds a fetched page or search stays cached
+WEB_FAILURE_TTL = 60  # Seconds a page that failed to download isn't tried again
+WEB_CACHE_SIZE = 256  # Max cached pages and searches
+WEB_FETCH_TOP = 3  # Pages of the top search results fetched along with the search
+WEB_FETCH_DEADLINE = 8  # Max seconds for a search and its page fetches
+WEB_PAGE_CHARS = 1000  # Characters of a page's main text given to the model
+
+# - - - Tool settings - - -
+TOOL_TIMEOUT = 30  # Max seconds a tool call may take before the model gets an error instead
+TOOL_TIMEOUTS = {"memorize": 60}  # Per-tool timeouts replacing TOOL_TIMEOUT
+TOOL_MAX_CONCURRENT = 4  # Max concurrent calls of the same tool
+TOOL_LIMITS = {"python": 2}  # Per-tool concurrency limits replacing TOOL_MAX_CONCURRENT
+SCRIPT_WORKERS = 2  # Worker processes running python tool scripts
+SCRIPT_TIMEOUT = 10  # Max seconds a script may run before its worker is killed
+SCRIPT_CPU_TIME = 5  # Max CPU seconds of a script
+SCRIPT_MEMORY_MB = 512  # Max memory of a worker process
+SCRIPT_FILE_MB = 10  # Max size of a file written by a script
+SCRIPT_MAX_OUTPUT = 4000  # Characters of script output returned to the model
+SCRIPT_RECYCLE_AFTER = 50  # Scripts run by a worker before it is replaced by a fresh one
+
+# - - - Speculative reply settings - - -
+# Generate the reply while the MPCA decides, and throw it away if the bot shouldn't answer
+SPECULATIVE_REPLY = False  # Opt-in: lower latency when replying, extra GPU work when not
+SPECULATIVE_MAX_INFLIGHT = 2  # Max speculative generations running at once
+SPECULATIVE_MAX_WASTED = 30  # Stop speculating once this many generations were thrown away in the last hour
+
 # - - - Advenced settings - - -
 # Multi-Party Conversation Agent (MPCA) tool_call structure
 # Must contain 'action' boolean to decide if the bot should reply or not
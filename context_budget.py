@@ -0,0 +1,74 @@
+"""
+context_budget.py
+Approximate token accounting for context messages, and what to trim to fit a token budget
+"""
+import json
+
+CHARS_PER_TOKEN = 4 # Rough average for English text and code
+MESSAGE_OVERHEAD = 4 # Role and separator tokens added by chat templates
+IMAGE_TOKENS = 768 # Typical cost of one image for vision models
+
+def entry_tokens(entry: dict) -> int:
+    """
+    Estimate the number of tokens of a context entry.
+
+    Args:
+        entry (dict): The context entry.
+
+    Returns:
+        int: Approximate token count.
+    """
+    content = entry.get('content') or ""
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False)
+
+    tokens = MESSAGE_OVERHEAD + len(content) // CHARS_PER_TOKEN
+    tokens += IMAGE_TOKENS * len(entry.get('images') or [])
+    return tokens
+
+def truncate_entry(entry: dict, max_tokens: int) -> dict:
+    """
+    Shorten an oversized entry, keeping the start and the end of its content.
+
+    Args:
+        entry (dict): The context entry.
+        max_tokens (int): The token count to fit in.
+
+    Returns:
+        dict: A truncated copy of the entry, or the entry itself if it already fits.
+    """
+    content = entry.get('content')
+    if not isinstance(content, str) or entry_tokens(entry) <= max_tokens:
+        return entry
+
+    keep = max(0, max_tokens - MESSAGE_OVERHEAD) * CHARS_PER_TOKEN
+    removed = (len(content) - keep) // CHARS_PER_TOKEN
+    truncated = dict(entry)
+    truncated['content'] = (
+        f"{content[:keep // 2]}\n[... {removed} tokens truncated ...]\n{content[len(content) - keep // 2:]}"
+    )
+    return truncated
+
+def summarize_count(token_counts: list, target: int, max_tokens: int) -> int:
+    """
+    Pick how many messages (after the system prompt) to summarize so the context falls under `target`.
+
+    Args:
+        token_counts (list): Token count of each message, system prompt first.
+        target (int): The token count the context should shrink to.
+        max_tokens (int): Max tokens that can be sent to the summarizer at once.
+
+    Returns:
+        int: Number of messages to summarize, 0 if the context already fits.
+    """
+    excess = sum(token_counts) - target
+    num = 0
+    summarized = 0
+    # Keep the last message: it is the one being answered
+    for tokens in token_counts[1:-1]:
+        if excess <= 0 or summarized + tokens > max_tokens:
+            break
+        excess -= tokens
+        summarized += tokens
+        num += 1
+    return num
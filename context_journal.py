@@ -0,0 +1,197 @@
+"""
+context_journal.py
+Append-only context persistence: a JSON snapshot plus a JSONL journal, written by a background thread
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+
+_jobs = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+def _run_worker() -> None:
+    """
+    Background writer loop. Runs every queued write job in order.
+
+    Returns: None
+    """
+    while True:
+        job, args = _jobs.get()
+        try:
+            job(*args)
+        except Exception as e:
+            print(f"[context_journal] Write failed: {e}")
+        finally:
+            _jobs.task_done()
+
+def _submit(job, *args) -> None:
+    """
+    Queue a write job, starting the background writer if needed.
+
+    Args:
+        job (callable): The function to run in the writer thread.
+        *args: Arguments for the job.
+
+    Returns: None
+    """
+    global _worker
+
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_worker, name="context-journal", daemon=True)
+            _worker.start()
+    _jobs.put((job, args))
+
+def flush() -> None:
+    """
+    Block until every queued write is on disk.
+
+    Returns: None
+    """
+    if _worker is not None:
+        _jobs.join()
+
+atexit.register(flush)
+
+class ContextJournal:
+    """
+    Persist a context list as a snapshot plus an append-only journal.
+    Each message costs one appended line; the snapshot is only rewritten on compaction.
+
+    Args:
+        snapshot_path (str): Path to the JSON snapshot.
+        journal_path (str): Path to the JSONL journal.
+        compact_every (int, optional): Compact after this many journaled entries. Defaults to 200.
+    """
+    def __init__(self, snapshot_path: str, journal_path: str, compact_every: int = 200):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.seq = 0 # Sequence number of the last journaled entry
+        self.pending = 0 # Entries journaled since the last compaction
+
+    def load(self) -> list:
+        """
+        Rebuild the context from the snapshot and the journal entries written after it.
+        Waits for the queued writes, so call it from a thread. A torn last line (crash while appending)
+        is cut off so the next entry starts on a line of its own.
+
+        Returns:
+            list: The restored context, empty if nothing was saved.
+        """
+        flush()
+
+        context = []
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                content = f.read().strip()
+            if content:
+                data = json.loads(content)
+                if isinstance(data, list): # Legacy context.json
+                    context = data
+                else:
+                    context = data["context"]
+                    snapshot_seq = data["seq"]
+
+        self.seq = snapshot_seq
+        self.pending = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb+") as f:
+                end = 0 # End of the last complete line
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn last line from a crash
+                        f.truncate(end)
+                        break
+                    end += len(line)
+                    try:
+                        record = json.loads(line)
+                        seq, entry = record["seq"], record["entry"]
+                    except (ValueError, KeyError, TypeError):
+                        continue # Skip a corrupted line, keep the entries after it
+                    self.seq = max(self.seq, seq)
+                    if seq > snapshot_seq:
+                        context.append(entry)
+                        self.pending += 1
+        return context
+
+    def last_write_time(self) -> float:
+        """
+        Get the time of the last persisted change. Waits for the queued writes, so call it from a thread.
+
+        Returns:
+            float: The newest modification time of the snapshot and journal, or None if neither exists.
+        """
+        flush()
+        times = [os.stat(p).st_mtime for p in (self.snapshot_path, self.journal_path) if os.path.exists(p)]
+        return max(times) if times else None
+
+    def append(self, entry: dict) -> bool:
+        """
+        Queue one entry to be appended to the journal.
+
+        Args:
+            entry (dict): The context entry.
+
+        Raises:
+            RuntimeError: If the entry can't be serialized.
+
+        Returns:
+            bool: True if the journal grew past `compact_every` and should be compacted.
+        """
+        self.seq += 1
+        try:
+            line = json.dumps({"seq": self.seq, "entry": entry}, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            self.seq -= 1
+            raise RuntimeError(f"Couldn't save context: {e}")
+
+        _submit(self._write_line, line)
+        self.pending += 1
+        return self.pending >= self.compact_every
+
+    def compact(self, context: list) -> None:
+        """
+        Queue a snapshot of the full context and reset the journal.
+
+        Args:
+            context (list): The full current context.
+
+        Returns: None
+        """
+        self.pending = 0
+        _submit(self._write_snapshot, list(context), self.seq)
+
+    def _write_line(self, line: str) -> None:
+        """
+        Append one serialized record to the journal. Runs in the writer thread.
+
+        Args:
+            line (str): The JSON record.
+
+        Returns: None
+        """
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def _write_snapshot(self, context: list, seq: int) -> None:
+        """
+        Atomically replace the snapshot, then empty the journal. Runs in the writer thread.
+
+        Args:
+            context (list): The context to snapshot.
+            seq (int): Sequence number of the last entry included in the snapshot.
+
+        Returns: None
+        """
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "context": context}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+
+        # Entries up to `seq` are in the snapshot; a crash before this point only leaves skipped duplicates
+        open(self.journal_path, "w", encoding="utf-8").close()
@@ -0,0 +1,244 @@
+"""
+conversation.py
+Per-channel conversation state, kept in memory while hot and evicted to disk when idle
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from context_budget import entry_tokens
+from context_journal import ContextJournal
+
+def entry_size(entry: dict) -> int:
+    """
+    Approximate the memory used by a context entry.
+
+    Args:
+        entry (dict): The context entry.
+
+    Returns:
+        int: Approximate size in characters.
+    """
+    return sum(len(str(v)) for v in entry.values())
+
+class Conversation:
+    """
+    One conversation (guild channel or DM): its messages and where they are persisted.
+
+    Args:
+        conversation_id (str): The conversation id, usually the Discord channel id.
+        messages (list): The context messages, starting with the system prompt.
+        journal (ContextJournal, optional): Where changes are persisted. None for throwaway conversations.
+        resumed (bool, optional): True if restored from disk for the first time since the bot started.
+    """
+    def __init__(self, conversation_id: str, messages: list, journal: ContextJournal = None, resumed: bool = False):
+        self.id = conversation_id
+        self.messages = messages
+        self.journal = journal
+        self.resumed = resumed
+        self.size = sum(entry_size(m) for m in messages)
+        self.token_counts = [entry_tokens(m) for m in messages] # Approximate tokens of each message
+        self.last_used = time.time()
+        self.lock = asyncio.Lock() # Held while a message of this conversation is being processed
+        self.summary_timer = None # Pending idle summarization (asyncio.TimerHandle)
+        self.summary_task = None # Running background summarization (asyncio.Task)
+        self.notes = [] # Entries sent after the messages for the current request only (e.g. retrieved file parts), never persisted
+
+    def append(self, entry: dict) -> None:
+        """
+        Append an entry and persist it.
+
+        Args:
+            entry (dict): The context entry.
+
+        Raises:
+            RuntimeError: If the entry can't be persisted.
+
+        Returns: None
+        """
+        needs_compaction = self.journal.append(entry) if self.journal else False
+        self.messages.append(entry)
+        self.size += entry_size(entry)
+        self.token_counts.append(entry_tokens(entry))
+        self.last_used = time.time()
+
+        if needs_compaction:
+            self.journal.compact(self.messages)
+
+    def replace(self, messages: list) -> None:
+        """
+        Replace all the messages (after a summarization) and persist the new state.
+
+        Args:
+            messages (list): The new context messages.
+
+        Returns: None
+        """
+        # Only count the tokens of new entries
+        known = {id(m): t for m, t in zip(self.messages, self.token_counts)}
+        self.token_counts = [known[id(m)] if id(m) in known else entry_tokens(m) for m in messages]
+
+        self.messages[:] = messages
+        self.size = sum(entry_size(m) for m in messages)
+        self.last_used = time.time()
+
+        if self.journal:
+            self.journal.compact(self.messages)
+
+    def set_system(self, entry: dict) -> None:
+        """
+        Replace the system prompt in memory (it is rebuilt on each message, so it isn't persisted).
+
+        Args:
+            entry (dict): The system message.
+
+        Returns: None
+        """
+        self.size += entry_size(entry) - entry_size(self.messages[0])
+        self.messages[0] = entry
+        self.token_counts[0] = entry_tokens(entry)
+
+    @property
+    def busy(self) -> bool:
+        """
+        Check if a message or a summarization of this conversation is in progress.
+
+        Returns:
+            bool: True if the conversation must stay in memory.
+        """
+        summarizing = self.summary_task is not None and not self.summary_task.done()
+        return self.lock.locked() or summarizing
+
+    @property
+    def tokens(self) -> int:
+        """
+        Approximate token count of the whole conversation.
+
+        Returns:
+            int: Sum of the message token estimates.
+        """
+        return sum(self.token_counts)
+
+    def fork(self) -> "Conversation":
+        """
+        Snapshot the conversation into a throwaway copy, e.g. to generate a reply speculatively.
+
+        Returns:
+            Conversation: A copy that is never persisted. Merge it back with `commit`.
+        """
+        fork = Conversation(self.id, list(self.messages))
+        fork.notes = list(self.notes)
+        fork.base_length = len(self.messages)
+        return fork
+
+    def commit(self, fork: "Conversation") -> None:
+        """
+        Append and persist the messages added to a fork since it was created.
+
+        Args:
+            fork (Conversation): A fork created by `fork`.
+
+        Returns: None
+        """
+        for entry in fork.messages[fork.base_length:]:
+            self.append(entry)
+
+class ConversationStore:
+    """
+    Keep recently used conversations in memory, evict the least recently used ones to disk
+    once `max_conversations` or `max_size` is exceeded, and reload them lazily.
+
+    Args:
+        folder (str): Folder holding one snapshot and journal per conversation.
+        max_conversations (int): Max number of conversations kept in memory.
+        max_size (int): Max total approximate size (in characters) of the conversations kept in memory.
+        compact_every (int, optional): Compact a conversation journal after this many entries. Defaults to 200.
+    """
+    def __init__(self, folder: str, max_conversations: int, max_size: int, compact_every: int = 200):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.folder = folder
+        self.max_conversations = max_conversations
+        self.max_size = max_size
+        self.compact_every = compact_every
+        self._hot = OrderedDict()
+        self._seen = set() # Conversations already loaded since the bot started
+        self._loading = {} # conversation id -> task loading it from disk
+
+    async def get(self, conversation_id, initial: list) -> Conversation:
+        """
+        Get a conversation, loading it from disk (in a thread) or creating it if needed.
+
+        Args:
+            conversation_id: The conversation id, usually the Discord channel id.
+            initial (list): Messages to start a new conversation with.
+
+        Returns:
+            Conversation: The conversation.
+        """
+        conversation_id = str(conversation_id)
+
+        conversation = self._hot.get(conversation_id)
+        if conversation is not None:
+            self._hot.move_to_end(conversation_id)
+            conversation.last_used = time.time()
+            return conversation
+
+        # Concurrent calls share one load
+        task = self._loading.get(conversation_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load(conversation_id, initial))
+            self._loading[conversation_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(conversation_id, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, conversation_id: str, initial: list) -> Conversation:
+        """
+        Load a conversation from disk, or create it, and keep it in memory.
+
+        Args:
+            conversation_id (str): The conversation id.
+            initial (list): Messages to start a new conversation with.
+
+        Returns:
+            Conversation: The conversation.
+        """
+        journal = ContextJournal(
+            os.path.join(self.folder, f"{conversation_id}.json"),
+            os.path.join(self.folder, f"{conversation_id}.jsonl"),
+            compact_every=self.compact_every
+        )
+        messages = await asyncio.to_thread(journal.load)
+        resumed = bool(messages) and conversation_id not in self._seen
+        self._seen.add(conversation_id)
+
+        conversation = Conversation(conversation_id, messages, journal, resumed=resumed)
+        if not messages:
+            for entry in initial:
+                conversation.append(entry)
+
+        self._hot[conversation_id] = conversation
+        self._evict()
+        return conversation
+
+    def _evict(self) -> None:
+        """
+        Move least recently used conversations out of memory until the store fits its caps.
+        The most recently used conversation and busy conversations are always kept.
+
+        Returns: None
+        """
+        while (
+            len(self._hot) > self.max_conversations
+            or sum(c.size for c in self._hot.values()) > self.max_size
+        ):
+            idle = [k for k, c in list(self._hot.items())[:-1] if not c.busy]
+            if not idle:
+                return
+
+            conversation = self._hot.pop(idle[0])
+            if conversation.summary_timer:
+                conversation.summary_timer.cancel()
+            conversation.journal.compact(conversation.messages)
@@ -0,0 +1,179 @@
+"""
+discord_reply.py
+Send replies to Discord: code-block aware splitting and progressive streaming edits
+"""
+import time
+
+FENCE = "```"
+
+def _open_fence(text: str) -> str:
+    """
+    Find the code block left open at the end of a text.
+
+    Args:
+        text (str): The text to inspect.
+
+    Returns:
+        str: The opening fence line (e.g. "```python") if a code block is open, otherwise None.
+    """
+    opening = None
+    for line in text.split("\n"):
+        if line.lstrip().startswith(FENCE):
+            opening = None if opening else line.strip()
+    return opening
+
+def _cut(message: str, split_point: int) -> tuple:
+    """
+    Cut a message at a position, closing the code block open at the cut in the head and reopening it in the tail.
+
+    Args:
+        message (str): The message to cut.
+        split_point (int): Where to cut.
+
+    Returns:
+        tuple: (head, tail, opening) where opening is the fence line of the code block open at the cut, or None.
+    """
+    head = message[:split_point]
+    tail = message[split_point:].lstrip("\n")
+
+    opening = _open_fence(head)
+    if opening:
+        head = f"{head}\n{FENCE}"
+        tail = f"{opening}\n{tail}"
+    return head, tail, opening
+
+def split_once(message: str, max_length: int = 2000) -> tuple:
+    """
+    Cut the head of a message to fit in one Discord message, without breaking code blocks.
+    A code block open at the cut is closed in the head and reopened in the tail.
+    The tail is always shorter than the message, so repeated cuts end.
+
+    Args:
+        message (str): The message to cut.
+        max_length (int): The maximum length of the head (default is 2000).
+
+    Returns:
+        tuple: (head, tail) where head is at most max_length characters.
+    """
+    limit = max_length - len(FENCE) - 1 # Room to close a code block
+    split_point = message.rfind("\n", 0, limit)
+    if split_point <= 0:
+        split_point = limit  # If no newline, split at the limit
+
+    head, tail, opening = _cut(message, split_point)
+
+    # Cut in or right after the opening line of a code block (e.g. a long line of minified json):
+    # the head holds no code and the tail would start over, cut the code line itself
+    if (opening and message[:split_point].strip() == opening) or len(tail) >= len(message):
+        head, tail, opening = _cut(message, limit)
+        if len(tail) >= len(message): # Fence line longer than a message, don't reopen it
+            head, tail = message[:max_length], message[max_length:]
+    return head, tail
+
+def split_message(message, max_length=2000) -> list:
+    """
+    Splits a message into chunks of at most max_length characters, keeping code blocks intact.
+
+    Args:
+        message (str): The message to split.
+        max_length (int): The maximum length of each chunk (default is 2000).
+
+    Returns:
+        list: A list of message chunks.
+
+    Example:
+        >>> [len(chunk) for chunk in split_message("```python\\n" + "x" * 5000)]
+        [2000, 2000, 1038]
+    """
+    chunks = []
+    while len(message) > max_length:
+        head, message = split_once(message, max_length)
+        chunks.append(head)
+    chunks.append(message)
+    return chunks
+
+class StreamingReply:
+    """
+    Show a reply while it is generated: send the first piece right away, then edit the message
+    at most every `edit_interval` seconds, rolling over to a new message at `max_length`.
+
+    Args:
+        channel (discord.abc.Messageable): Where to send the reply.
+        edit_interval (float): Minimum delay between two edits of the same message, in seconds.
+        max_length (int, optional): Discord message length limit. Defaults to 2000.
+    """
+    def __init__(self, channel, edit_interval: float, max_length: int = 2000):
+        self.channel = channel
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        self.message = None # Discord message being edited
+        self.shown = "" # Text currently displayed in self.message
+        self.text = "" # Text of the current part, displayed or not
+        self.last_update = 0.0
+
+    async def _show(self, text: str) -> None:
+        """
+        Display a text in the current message, sending it if needed.
+
+        Args:
+            text (str): The text to display.
+
+        Returns: None
+        """
+        if not text.strip() or text == self.shown:
+            return
+
+        if self.message is None:
+            self.message = await self.channel.send(text)
+        else:
+            await self.message.edit(content=text)
+        self.shown = text
+        self.last_update = time.monotonic()
+
+    async def push(self, piece: str) -> None:
+        """
+        Add a piece of the reply and update Discord if the edit interval allows it.
+
+        Args:
+            piece (str): The new text.
+
+        Returns: None
+        """
+        self.text += piece
+
+        while len(self.text) > self.max_length:
+            head, self.text = split_once(self.text, self.max_length)
+            await self._show(head)
+            self.message = None
+            self.shown = ""
+
+        if self.message is None or time.monotonic() - self.last_update >= self.edit_interval:
+            await self._show(self.text)
+
+    async def finish(self) -> None:
+        """
+        Display the remaining text.
+
+        Returns: None
+        """
+        await self._show(self.text)
+
+async def stream_reply(channel, pieces, edit_interval: float) -> str:
+    """
+    Stream a generated reply into Discord messages.
+
+    Args:
+        channel (discord.abc.Messageable): Where to send the reply.
+        pieces (AsyncIterator[str]): The reply pieces, e.g. from `Llm.chat_stream`.
+        edit_interval (float): Minimum delay between two edits of the same message, in seconds.
+
+    Returns:
+        str: The full reply.
+    """
+    reply = StreamingReply(channel, edit_interval)
+    full = ""
+    async for piece in pieces:
+        full += piece
+        await reply.push(piece)
+    await reply.finish()
+    return full
@@ -0,0 +1,145 @@
+"""
+disk_cache.py
+Small persistent key/value cache with LRU eviction (sqlite backed)
+"""
+import os
+import sqlite3
+import threading
+import time
+
+class DiskCache:
+    """
+    Persistent bytes cache stored in a single sqlite file.
+    Least recently used entries are evicted once `max_entries` or `max_bytes` is exceeded.
+
+    Args:
+        path (str): Path to the sqlite file.
+        max_entries (int, optional): Max number of entries to keep. Defaults to None (unbounded).
+        max_bytes (int, optional): Max total size of the stored values. Defaults to None (unbounded).
+    """
+    def __init__(self, path: str, max_entries: int = None, max_bytes: int = None):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache(last_used)")
+        self._db.commit()
+
+    def get(self, key: str) -> bytes:
+        """
+        Get a value and mark it as recently used.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            bytes: The stored value, or None if missing.
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list) -> dict:
+        """
+        Get several values at once and mark them as recently used.
+
+        Args:
+            keys (list): The keys to look up.
+
+        Returns:
+            dict: Mapping of found keys to their value. Missing keys are left out.
+        """
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # sqlite limits the number of bound parameters, so look up in slices
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._db.execute(f"SELECT key, value FROM cache WHERE key IN ({marks})", part).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE cache SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                self._db.commit()
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Store a value.
+
+        Args:
+            key (str): The key to store.
+            value (bytes): The value to store.
+
+        Returns: None
+        """
+        self.set_many({key: value})
+
+    def set_many(self, items: dict) -> None:
+        """
+        Store several values at once, then evict the least recently used entries if over the limits.
+
+        Args:
+            items (dict): Mapping of keys to bytes values.
+
+        Returns: None
+        """
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                [(k, v, len(v), now) for k, v in items.items()]
+            )
+            self._evict()
+            self._db.commit()
+
+    def delete(self, key: str) -> None:
+        """
+        Remove a value if present.
+
+        Args:
+            key (str): The key to remove.
+
+        Returns: None
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used entries until the cache fits its limits. Must be called with the lock held.
+
+        Returns: None
+        """
+        if self.max_entries is not None:
+            count = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+        if self.max_bytes is not None:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                victims = []
+                for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY last_used"):
+                    victims.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                self._db.executemany("DELETE FROM cache WHERE key = ?", victims)
@@ -0,0 +1,125 @@
+"""
+doc_index.py
+Retrieval over uploaded documents: large files are split in chunks and indexed per conversation,
+only the chunks relevant to the current message are sent to the model
+"""
+import threading
+
+from conf_module import load_conf
+from embedding import embed
+from rag_embedding import client
+
+MODEL = load_conf("EMBED_MODEL")
+
+_collections = {} # conversation id -> chroma collection, None if it has no document
+_lock = threading.Lock()
+
+def chunk_text(text: str, size: int, overlap: int) -> list:
+    """
+    Split a text in chunks of about `size` characters, cut at paragraph, line or sentence boundaries when possible.
+
+    Args:
+        text (str): The text to split.
+        size (int): Max chunk length in characters.
+        overlap (int): Characters repeated between consecutive chunks, so no passage is cut off from its context.
+
+    Returns:
+        list: The chunks, in text order.
+    """
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            for separator in ("\n\n", "\n", ". "):
+                cut = text.rfind(separator, start, end)
+                if cut > start + size // 2:
+                    end = cut + len(separator)
+                    break
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def _collection(conversation_id: str, create: bool = False):
+    """
+    Get the document collection of a conversation. Must be called with the lock held.
+
+    Args:
+        conversation_id (str): The conversation id.
+        create (bool, optional): Create the collection if missing. Defaults to False.
+
+    Returns:
+        chromadb.Collection: The collection, or None if the conversation has no document.
+    """
+    collection = _collections.get(conversation_id)
+    if collection is None and (create or conversation_id not in _collections):
+        name = f"docs_{conversation_id}"
+        if create:
+            collection = client.get_or_create_collection(name=name, metadata={"embed_model": MODEL})
+        else:
+            try:
+                collection = client.get_collection(name=name)
+            except Exception:
+                collection = None
+        _collections[conversation_id] = collection
+    return collection
+
+def index_document(conversation_id: str, doc_id: str, filename: str, text: str) -> int:
+    """
+    Split a document in chunks and index them in the conversation's collection.
+    Indexing the same document again only refreshes it.
+
+    Args:
+        conversation_id (str): The conversation the file was uploaded in.
+        doc_id (str): Unique id of the document content (e.g. its hash).
+        filename (str): The file name, shown with the retrieved chunks.
+        text (str): The document text.
+
+    Returns:
+        int: Number of chunks indexed.
+    """
+    chunks = chunk_text(text, load_conf('DOC_CHUNK_SIZE'), load_conf('DOC_CHUNK_OVERLAP'))
+    if not chunks:
+        return 0
+
+    embeddings = embed(chunks)
+    with _lock:
+        collection = _collection(str(conversation_id), create=True)
+
+    collection.upsert(
+        ids=[f"{doc_id}:{i}" for i in range(len(chunks))],
+        embeddings=embeddings,
+        documents=chunks,
+        metadatas=[{"file": filename, "chunk": i} for i in range(len(chunks))]
+    )
+    return len(chunks)
+
+def search(conversation_id: str, query: str, k: int) -> list:
+    """
+    Find the chunks of the conversation's documents most relevant to a query.
+
+    Args:
+        conversation_id (str): The conversation id.
+        query (str): The text to search for, usually the new message.
+        k (int): Max number of chunks to return.
+
+    Returns:
+        list: (file name, chunk) tuples, most relevant first. Empty if the conversation has no document.
+    """
+    with _lock:
+        collection = _collection(str(conversation_id))
+
+    if collection is None or not query.strip():
+        return []
+
+    count = collection.count()
+    if count == 0:
+        return []
+
+    results = collection.query(query_embeddings=embed(query), n_results=min(k, count))
+    return [(meta["file"], doc) for meta, doc in zip(results["metadatas"][0], results["documents"][0])]
@@ -0,0 +1,68 @@
+"""
+embedding.py
+Embedding service: batched embed requests with a persistent content-hash cache
+"""
+import hashlib
+from array import array
+
+from conf_module import load_conf
+from disk_cache import DiskCache
+from ollama_pool import pool
+
+MODEL = load_conf("EMBED_MODEL")
+BATCH_SIZE = load_conf("EMBED_BATCH_SIZE")
+
+cache = DiskCache(load_conf("EMBED_CACHE_FILE"), max_entries=load_conf("EMBED_CACHE_SIZE"))
+
+def _cache_key(text: str, model: str) -> str:
+    """
+    Build the cache key of a text for a model.
+
+    Args:
+        text (str): The embedded text.
+        model (str): The embed model.
+
+    Returns:
+        str: Hex digest of (model, text).
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+def embed(texts, model: str = None) -> list:
+    """
+    Embed one or several texts. Cached texts are not sent again, the others are sent in batches of EMBED_BATCH_SIZE.
+
+    Args:
+        texts (str | list): The text or list of texts to embed.
+        model (str, optional): The embed model. Defaults to EMBED_MODEL.
+
+    Returns:
+        list: One embedding (list of floats) per input text, in input order.
+    """
+    if model is None:
+        model = MODEL
+
+    if isinstance(texts, str):
+        texts = [texts]
+
+    keys = [_cache_key(t, model) for t in texts]
+    vectors = {k: array("f", v).tolist() for k, v in cache.get_many(keys).items()}
+
+    # Embed each missing text once, even if repeated in the input
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors:
+            missing.setdefault(key, text)
+
+    missing = list(missing.items())
+    for i in range(0, len(missing), BATCH_SIZE):
+        batch = missing[i:i + BATCH_SIZE]
+        with pool.use_sync(model) as host:
+            response = host.sync_client.embed(model=model, input=[text for _, text in batch], keep_alive=load_conf("KEEP_ALIVE"))
+
+        new_entries = {}
+        for (key, _), vector in zip(batch, response["embeddings"]):
+            vectors[key] = vector
+            new_entries[key] = array("f", vector).tobytes()
+        cache.set_many(new_entries)
+
+    return [vectors[k] for k in keys]
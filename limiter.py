@@ -0,0 +1,156 @@
+"""
+limiter.py
+Concurrency limits for asyncio code (per model, per host, per tool...), the speculation budget and prioritized slots
+"""
+import asyncio
+import contextlib
+import heapq
+import time
+from collections import deque
+
+class KeyedLimiter:
+    """
+    One semaphore per key, created on first use.
+
+    Args:
+        limit (int): Default number of concurrent holders per key.
+        overrides (dict, optional): Per-key limits replacing the default. Defaults to None.
+
+    Example:
+        async with model_limits.hold("qwen3:8b"):
+            ...
+    """
+    def __init__(self, limit: int, overrides: dict = None):
+        self.limit = limit
+        self.overrides = overrides or {}
+        self._semaphores = {}
+
+    def hold(self, key) -> asyncio.Semaphore:
+        """
+        Get the semaphore of a key, to be used with `async with`.
+
+        Args:
+            key: The limited resource (model name, host link, tool name...).
+
+        Returns:
+            asyncio.Semaphore: The key's semaphore.
+        """
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.overrides.get(key, self.limit))
+            self._semaphores[key] = semaphore
+        return semaphore
+
+class SpeculationBudget:
+    """
+    Cap the GPU work spent on speculative generations: at most `max_inflight` at once,
+    and no new speculation once `max_wasted` were thrown away within the last `window` seconds.
+
+    Args:
+        max_inflight (int): Max speculative generations running at once.
+        max_wasted (int): Max discarded speculative generations per window.
+        window (float, optional): Length of the waste window in seconds. Defaults to 3600.
+    """
+    def __init__(self, max_inflight: int, max_wasted: int, window: float = 3600):
+        self.max_inflight = max_inflight
+        self.max_wasted = max_wasted
+        self.window = window
+        self.inflight = 0
+        self._wasted = deque()
+
+    def try_acquire(self) -> bool:
+        """
+        Reserve a speculation slot if the budget allows it. Release it with `release`.
+
+        Returns:
+            bool: True if the caller may speculate.
+        """
+        now = time.monotonic()
+        while self._wasted and now - self._wasted[0] > self.window:
+            self._wasted.popleft()
+
+        if self.inflight >= self.max_inflight or len(self._wasted) >= self.max_wasted:
+            return False
+
+        self.inflight += 1
+        return True
+
+    def release(self, wasted: bool) -> None:
+        """
+        Free a speculation slot.
+
+        Args:
+            wasted (bool): True if the speculative generation was thrown away.
+
+        Returns: None
+        """
+        self.inflight -= 1
+        if wasted:
+            self._wasted.append(time.monotonic())
+
+class PrioritySemaphore:
+    """
+    Semaphore handing free slots to the waiter with the lowest priority value first (FIFO among equals).
+
+    Args:
+        value (int): Number of slots.
+
+    Example:
+        async with turn_slots.hold(0): # 0 goes before 1
+            ...
+    """
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters = [] # heap of (priority, order, future)
+        self._order = 0
+
+    async def acquire(self, priority: int = 0) -> None:
+        """
+        Wait for a free slot.
+
+        Args:
+            priority (int, optional): Lower values are served first. Defaults to 0.
+
+        Returns: None
+        """
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._order += 1
+        heapq.heappush(self._waiters, (priority, self._order, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over right before the cancellation
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """
+        Free a slot, giving it to the first waiter if any.
+
+        Returns: None
+        """
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+    @contextlib.asynccontextmanager
+    async def hold(self, priority: int = 0):
+        """
+        Hold a slot, to be used with `async with`.
+
+        Args:
+            priority (int, optional): Lower values are served first. Defaults to 0.
+        """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
@@ -2,6 +2,10 @@
 load_file.py
 Convert a file into text format (rax text, file handling, audio transcription...)
 """
+import codecs
+import io
+import itertools
+import mmap
 import os
 import chardet
 from docx import Document
@@ -9,53 +13,157 @@ from odf.opendocument import load as load_odt
 from odf.text import P
 from striprtf.striprtf import rtf_to_text
 from PyPDF2 import PdfReader
+from PIL import Image
 
-def load_file(file_path: str) -> str:
+ENCODING_SAMPLE = 64 * 1024 # Bytes read to detect the encoding of plain text files
+MMAP_THRESHOLD = 4 * 1024 * 1024 # Plain text files bigger than this are memory mapped
+READ_BLOCK = 256 * 1024 # Bytes decoded at once
+
+def normalize_image(file_path: str, max_side: int, quality: int) -> bytes:
     """
-    Load and return the contents of a text-based file in many formats.
-    
+    Prepare an image for vision models: downscale it so its longest side fits `max_side`, and encode it as jpeg.
+
     Args:
-        file_path (str): The absolute path to the file.
+        file_path (str): The absolute path to the image.
+        max_side (int): Max width and height in pixels.
+        quality (int): Jpeg quality (1-95).
 
     Returns:
-        str: The text content of the file or an error message.
+        bytes: The jpeg image.
     """
-    if not os.path.isabs(file_path):
-        return("Please provide an absolute file path.")
+    with Image.open(file_path) as img:
+        img.seek(0) # First frame of animated images
+        img.thumbnail((max_side, max_side))
 
-    if not os.path.isfile(file_path):
-        return(f"No such file: {file_path}")
+        # Jpeg has no transparency, flatten it on white
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        output = io.BytesIO()
+        img.save(output, "JPEG", quality=quality, optimize=True)
+        return output.getvalue()
+
+def _joined(parts):
+    """
+    Yield text parts separated by new lines.
+
+    Args:
+        parts (iterable): The text parts (paragraphs, pages...).
+
+    Yields:
+        str: The parts, each one after the first preceded by a new line.
+    """
+    first = True
+    for part in parts:
+        yield part if first else "\n" + part
+        first = False
+
+def _iter_raw_text(file_path: str, max_bytes: int = None):
+    """
+    Decode a plain text file incrementally. The encoding is detected on the first ENCODING_SAMPLE bytes only,
+    and big files are memory mapped rather than read at once.
+
+    Args:
+        file_path (str): The path to the file.
+        max_bytes (int, optional): Max bytes to read. Defaults to None (whole file).
+
+    Yields:
+        str: Decoded blocks of text.
+    """
+    size = os.path.getsize(file_path)
+    if max_bytes is not None:
+        size = min(size, max_bytes)
+    if size == 0:
+        return
+
+    with open(file_path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > MMAP_THRESHOLD else f.read(size)
+        try:
+            encoding = chardet.detect(data[:ENCODING_SAMPLE])["encoding"] or "utf-8"
+            # An ascii sample says nothing about the rest of the file, utf-8 is a safe superset
+            if encoding.lower() == "ascii":
+                encoding = "utf-8"
+
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            for start in range(0, size, READ_BLOCK):
+                text = decoder.decode(data[start:min(start + READ_BLOCK, size)])
+                if text:
+                    yield text
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
 
+def iter_text(file_path: str, max_pages: int = None, max_bytes: int = None):
+    """
+    Extract the text of a file in many formats, piece by piece, so the caller can stop as soon as it has enough.
+
+    Args:
+        file_path (str): The absolute path to the file.
+        max_pages (int, optional): Max pdf pages to read. Defaults to None (all pages).
+        max_bytes (int, optional): Max bytes of plain text and rtf files to read. Defaults to None (whole file).
+
+    Yields:
+        str: Consecutive pieces of the text (paragraphs, pages or blocks).
+    """
     ext = os.path.splitext(file_path)[1].lower()
 
     if ext == ".docx":
         doc = Document(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
+        yield from _joined(para.text for para in doc.paragraphs)
 
     elif ext == ".odt":
         doc = load_odt(file_path)
-        paragraphs = [t.data for t in doc.getElementsByType(P)]
-        return "\n".join(paragraphs)
+        yield from _joined(t.data for t in doc.getElementsByType(P))
 
     elif ext == ".rtf":
         with open(file_path, "r", errors="ignore") as f:
-            return rtf_to_text(f.read())
+            yield rtf_to_text(f.read(max_bytes) if max_bytes is not None else f.read())
 
     elif ext == ".pdf":
         reader = PdfReader(file_path)
-        text = []
-        for page in reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text.append(extracted)
-        return "\n".join(text)
+        pages = (page.extract_text() for page in itertools.islice(reader.pages, max_pages))
+        yield from _joined(text for text in pages if text)
 
     else:
-        try:
-            with open(file_path, "rb") as f:
-                raw = f.read()
-            detected = chardet.detect(raw)
-            encoding = detected["encoding"] or "utf-8"
-            return raw.decode(encoding, errors="replace")
-        except Exception as e :
-            return(f"Error while uploading script: {e}")
\ No newline at end of file
+        yield from _iter_raw_text(file_path, max_bytes)
+
+def load_file(file_path: str, max_chars: int = None, max_pages: int = None, max_bytes: int = None) -> str:
+    """
+    Load and return the contents of a text-based file in many formats.
+    
+    Args:
+        file_path (str): The absolute path to the file.
+        max_chars (int, optional): Stop extracting after this many characters. Defaults to None (whole file).
+        max_pages (int, optional): Max pdf pages to read. Defaults to None (all pages).
+        max_bytes (int, optional): Max bytes of plain text and rtf files to read. Defaults to None (whole file).
+
+    Returns:
+        str: The text content of the file or an error message.
+    """
+    if not os.path.isabs(file_path):
+        return("Please provide an absolute file path.")
+
+    if not os.path.isfile(file_path):
+        return(f"No such file: {file_path}")
+
+    try:
+        text = []
+        length = 0
+        for piece in iter_text(file_path, max_pages, max_bytes):
+            if max_chars is not None and length + len(piece) > max_chars:
+                text.append(piece[:max_chars - length])
+                text.append("\n[... file truncated ...]")
+                break
+            text.append(piece)
+            length += len(piece)
+        return "".join(text)
+    except Exception as e :
+        return(f"Error while uploading script: {e}")
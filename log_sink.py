@@ -0,0 +1,111 @@
+"""
+log_sink.py
+Bounded response logging: JSONL lines, rotated by size or age, optionally gzip compressed
+"""
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from collections import deque
+
+import conf_module
+
+LOG_FILE = conf_module.load_conf('LOG_FILE')
+LOG_MAX_BYTES = conf_module.load_conf('LOG_MAX_BYTES')
+LOG_MAX_AGE = conf_module.load_conf('LOG_MAX_AGE')
+LOG_BACKUP_COUNT = conf_module.load_conf('LOG_BACKUP_COUNT')
+LOG_COMPRESS = conf_module.load_conf('LOG_COMPRESS')
+
+# Last responses, kept in memory for debugging
+recent = deque(maxlen=conf_module.load_conf('LOG_RING_SIZE'))
+
+class RotatingJsonlHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotating file handler that also rolls over when the current file gets older than `max_age`,
+    and gzips rotated files when `compress` is set.
+
+    Args:
+        filename (str): Path of the active log file.
+        max_bytes (int): Rotate once the file reaches this size. 0 disables size rotation.
+        backup_count (int): Number of rotated files to keep.
+        max_age (int): Rotate once the file is older than this many seconds. 0 disables age rotation.
+        compress (bool): Gzip rotated files.
+    """
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, max_age: int, compress: bool):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.max_age = max_age
+        self.opened = os.stat(filename).st_mtime if os.path.exists(filename) else time.time()
+
+        if compress:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = self._gzip_rotator
+
+    def shouldRollover(self, record) -> bool:
+        """
+        Check if the record should go to a new file, by age then by size.
+
+        Args:
+            record (logging.LogRecord): The record about to be written.
+
+        Returns:
+            bool: True if the file must be rotated first.
+        """
+        if self.max_age and time.time() - self.opened >= self.max_age:
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        """
+        Rotate the files and restart the age timer.
+
+        Returns: None
+        """
+        super().doRollover()
+        self.opened = time.time()
+
+    @staticmethod
+    def _gzip_rotator(source: str, dest: str) -> None:
+        """
+        Compress a rotated file.
+
+        Args:
+            source (str): The file being rotated.
+            dest (str): The compressed destination.
+
+        Returns: None
+        """
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+logger = logging.getLogger("ollamacord.responses")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+_handler = RotatingJsonlHandler(LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_MAX_AGE, LOG_COMPRESS)
+_handler.setFormatter(logging.Formatter("%(message)s"))
+
+# Writes and rotations happen on the listener thread, never on the caller
+_queue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_queue))
+_listener = logging.handlers.QueueListener(_queue, _handler)
+_listener.start()
+atexit.register(_listener.stop)
+
+def log_response(data: dict) -> None:
+    """
+    Log one model response as a single JSONL line.
+
+    Args:
+        data (dict): The response, as returned by `response.model_dump(mode='json')`.
+
+    Returns: None
+    """
+    recent.append(data)
+    logger.info(json.dumps(data, ensure_ascii=False))
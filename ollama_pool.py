@@ -0,0 +1,297 @@
+"""
+ollama_pool.py
+Pool of Ollama hosts: routes each request to the host that already has the model loaded, is the least busy and
+answers the fastest, keeps a conversation on the same host (warm KV cache), and ejects hosts that stop answering
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+from ollama import AsyncClient, Client
+from ollama._types import ResponseError
+
+import conf_module
+
+COLD_START = 10.0 # Estimated seconds to load a model on a host that doesn't have it loaded
+DEFAULT_LATENCY = 1.0 # Estimated seconds per request before a host was measured
+LATENCY_SMOOTHING = 0.2 # Weight of the newest measurement in the latency moving average
+MAX_STICKY = 1000 # Max remembered conversation -> host assignments
+
+def model_key(model: str) -> str:
+    """
+    Normalize a model name the way /api/ps reports it.
+
+    Args:
+        model (str): The model name, with or without tag.
+
+    Returns:
+        str: The name with its tag (":latest" if none).
+    """
+    return model if ":" in model else f"{model}:latest"
+
+def is_host_failure(error: Exception) -> bool:
+    """
+    Tell if an error means the host itself is unhealthy (unreachable, timing out, server error),
+    rather than a problem with the request.
+
+    Args:
+        error (Exception): The raised error.
+
+    Returns:
+        bool: True if the error should count against the host.
+    """
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+class Host:
+    """
+    One Ollama endpoint and what the pool knows about it.
+
+    Args:
+        link (str): The host URL.
+    """
+    def __init__(self, link: str):
+        self.link = link
+        self.client = AsyncClient(host=link)
+        self.sync_client = Client(host=link) # For calls made from worker threads (embeddings)
+        self.inflight = 0
+        self.latency = None # Moving average of the request duration, in seconds
+        self.loaded = set() # Models in memory, from /api/ps
+        self.failures = 0 # Consecutive failures
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        """
+        Check if the host can receive requests.
+
+        Returns:
+            bool: False while the host is ejected.
+        """
+        return time.monotonic() >= self.ejected_until
+
+    def estimate(self, model: str) -> float:
+        """
+        Estimate how long a new request for a model would take on this host.
+
+        Args:
+            model (str): The requested model.
+
+        Returns:
+            float: Estimated seconds, queueing and model loading included.
+        """
+        latency = self.latency if self.latency is not None else DEFAULT_LATENCY
+        cold = 0.0 if model is None or model_key(model) in self.loaded else COLD_START
+        return (self.inflight + 1) * latency + cold
+
+class OllamaPool:
+    """
+    Route requests across Ollama hosts.
+
+    Args:
+        links (list): The host URLs.
+        max_failures (int, optional): Consecutive failures before a host is ejected. Defaults to 3.
+        eject_time (float, optional): Seconds an ejected host is left alone before being tried again. Defaults to 30.
+        sticky_slack (int, optional): Max extra in-flight requests tolerated on a conversation's host before moving it. Defaults to 2.
+
+    Example:
+        async with pool.use(model, conversation.id) as host:
+            response = await host.client.chat(model=model, messages=messages)
+    """
+    def __init__(self, links: list, max_failures: int = 3, eject_time: float = 30, sticky_slack: int = 2):
+        self.hosts = [Host(link) for link in links]
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.sticky_slack = sticky_slack
+        self._sticky = OrderedDict() # route key -> host
+        self._lock = threading.Lock() # Counters are updated from the event loop and from worker threads
+        self._monitor = None
+
+    def pick(self, model: str = None, route=None, exclude: "Host" = None) -> Host:
+        """
+        Choose the host for a request.
+
+        Args:
+            model (str, optional): The requested model. Defaults to None (any host).
+            route (optional): Sticky routing key, usually the conversation id. Defaults to None.
+            exclude (Host, optional): Host to avoid, e.g. the one a hedged request already went to. Defaults to None.
+
+        Returns:
+            Host: The chosen host.
+        """
+        with self._lock:
+            candidates = [h for h in self.hosts if h.healthy and h is not exclude]
+            if not candidates:
+                # Everything is ejected: try the host that will be readmitted first
+                candidates = [min((h for h in self.hosts if h is not exclude), key=lambda h: h.ejected_until, default=self.hosts[0])]
+
+            best = min(candidates, key=lambda h: h.estimate(model))
+
+            if route is not None:
+                sticky = self._sticky.get(route)
+                if sticky in candidates and sticky.inflight <= best.inflight + self.sticky_slack:
+                    best = sticky
+                self._sticky[route] = best
+                self._sticky.move_to_end(route)
+                while len(self._sticky) > MAX_STICKY:
+                    self._sticky.popitem(last=False)
+
+            return best
+
+    def _start(self, host: Host) -> float:
+        """
+        Count a request starting on a host.
+
+        Args:
+            host (Host): The host.
+
+        Returns:
+            float: Start time.
+        """
+        with self._lock:
+            host.inflight += 1
+        return time.monotonic()
+
+    def _finish(self, host: Host, model: str, started: float, error: BaseException = None) -> None:
+        """
+        Count a request ending on a host and update its latency and health.
+
+        Args:
+            host (Host): The host.
+            model (str): The requested model.
+            started (float): Start time, from `_start`.
+            error (BaseException, optional): The error raised by the request, if any. Defaults to None.
+                A cancelled request only frees its slot.
+
+        Returns: None
+        """
+        with self._lock:
+            host.inflight -= 1
+            if error is None:
+                elapsed = time.monotonic() - started
+                host.latency = elapsed if host.latency is None else (1 - LATENCY_SMOOTHING) * host.latency + LATENCY_SMOOTHING * elapsed
+                host.failures = 0
+                if model is not None:
+                    host.loaded.add(model_key(model))
+            elif isinstance(error, Exception) and is_host_failure(error):
+                self._fail(host)
+
+    def _fail(self, host: Host) -> None:
+        """
+        Record a failure of a host, and eject it after `max_failures` in a row. Must be called with the lock held.
+
+        Args:
+            host (Host): The failing host.
+
+        Returns: None
+        """
+        host.failures += 1
+        if host.failures >= self.max_failures:
+            if host.healthy:
+                print(f"[ollama_pool] Ejecting {host.link} for {self.eject_time}s after {host.failures} failures.")
+            host.ejected_until = time.monotonic() + self.eject_time
+            # Readmitted hosts are ejected again on their next failure
+            host.failures = self.max_failures - 1
+
+    @contextlib.asynccontextmanager
+    async def use(self, model: str = None, route=None, exclude: Host = None):
+        """
+        Pick a host and track the request made with it, to be used with `async with`.
+
+        Args:
+            model (str, optional): The requested model. Defaults to None.
+            route (optional): Sticky routing key, usually the conversation id. Defaults to None.
+            exclude (Host, optional): Host to avoid. Defaults to None.
+
+        Yields:
+            Host: The chosen host.
+        """
+        host = self.pick(model, route, exclude)
+        started = self._start(host)
+        try:
+            yield host
+        except BaseException as e:
+            self._finish(host, model, started, e)
+            raise
+        self._finish(host, model, started)
+
+    @contextlib.contextmanager
+    def use_sync(self, model: str = None, route=None):
+        """
+        Same as `use`, for blocking calls made from worker threads.
+
+        Args:
+            model (str, optional): The requested model. Defaults to None.
+            route (optional): Sticky routing key. Defaults to None.
+
+        Yields:
+            Host: The chosen host.
+        """
+        host = self.pick(model, route)
+        started = self._start(host)
+        try:
+            yield host
+        except BaseException as e:
+            self._finish(host, model, started, e)
+            raise
+        self._finish(host, model, started)
+
+    async def check(self, host: Host) -> bool:
+        """
+        Refresh the models loaded on a host (/api/ps), which also serves as its health check.
+        A host answering again after being ejected is readmitted.
+
+        Args:
+            host (Host): The host to check.
+
+        Returns:
+            bool: True if the host answered.
+        """
+        try:
+            response = await host.client._request_raw("GET", "/api/ps", timeout=5)
+            models = {model_key(m.get("name") or m.get("model")) for m in response.json().get("models", [])}
+        except Exception:
+            with self._lock:
+                self._fail(host)
+            return False
+
+        with self._lock:
+            host.loaded = models
+            host.failures = 0
+            if not host.healthy:
+                print(f"[ollama_pool] Readmitting {host.link}.")
+                host.ejected_until = 0.0
+        return True
+
+    async def monitor(self, interval: float) -> None:
+        """
+        Check every host every `interval` seconds, forever.
+
+        Args:
+            interval (float): Seconds between two checks.
+
+        Returns: None
+        """
+        while True:
+            await asyncio.gather(*(self.check(host) for host in self.hosts))
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """
+        Start the background health checks (every POOL_CHECK_INTERVAL seconds), if not already running. Needs a running event loop.
+
+        Returns: None
+        """
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.create_task(self.monitor(conf_module.load_conf('POOL_CHECK_INTERVAL')))
+
+pool = OllamaPool(
+    conf_module.load_conf('OLLAMA_HOSTS') or [conf_module.load_conf('LINK')],
+    max_failures=conf_module.load_conf('POOL_MAX_FAILURES'),
+    eject_time=conf_module.load_conf('POOL_EJECT_TIME'),
+    sticky_slack=conf_module.load_conf('POOL_STICKY_SLACK')
+)
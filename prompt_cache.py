@@ -0,0 +1,94 @@
+"""
+prompt_cache.py
+Prompt layout for Ollama's prefix cache, and statistics on how much of each prompt it reused.
+Requests are laid out as: stable system prompt, append-only history, volatile notes at the tail.
+Anything rewritten before the tail (a summary, a dropped image) makes Ollama evaluate the prompt again from there.
+"""
+import json
+from collections import Counter
+
+from context_budget import entry_tokens
+
+REPORT_EVERY = 50 # Print the statistics every N requests
+
+stats = Counter()
+
+def render_entry(entry: dict) -> str:
+    """
+    Render a context entry as one transcript line. The same entry always renders the same way,
+    so a transcript only grows at its end and keeps its cached prefix.
+
+    Args:
+        entry (dict): The context entry.
+
+    Returns:
+        str: The transcript line.
+    """
+    content = entry.get('content') or ""
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False)
+
+    if entry.get('user'):
+        return f"[{entry['role']}] {entry['user']}: {content}"
+    return f"[{entry['role']}] {content}"
+
+def transcript(messages: list) -> str:
+    """
+    Render context entries as a transcript, e.g. for the MPCA.
+
+    Args:
+        messages (list): The context entries.
+
+    Returns:
+        str: One line per entry.
+    """
+    return "\n".join(render_entry(m) for m in messages)
+
+def prompt_tokens(messages: list) -> int:
+    """
+    Estimate the prompt size of a request.
+
+    Args:
+        messages (list): The request messages.
+
+    Returns:
+        int: Approximate token count.
+    """
+    return sum(entry_tokens(m) for m in messages)
+
+def record(response: dict, total_tokens: int) -> None:
+    """
+    Account a response: Ollama's prompt_eval_count only counts the prompt tokens it had to evaluate,
+    the rest of the prompt came from its cache.
+
+    Args:
+        response (dict): The response dump (final chunk when streaming).
+        total_tokens (int): Estimated size of the whole prompt.
+
+    Returns: None
+    """
+    evaluated = response.get('prompt_eval_count')
+    if evaluated is None:
+        return
+
+    stats['requests'] += 1
+    stats['prompt_tokens'] += max(total_tokens, evaluated)
+    stats['evaluated_tokens'] += evaluated
+    stats['eval_ns'] += response.get('prompt_eval_duration') or 0
+
+    if stats['requests'] % REPORT_EVERY == 0:
+        print(
+            f"[prompt_cache] {stats['requests']} requests: {hit_rate():.0%} of prompt tokens reused, "
+            f"{stats['eval_ns'] / stats['requests'] / 1e6:.0f} ms prompt evaluation on average"
+        )
+
+def hit_rate() -> float:
+    """
+    Share of the prompt tokens served from Ollama's cache so far.
+
+    Returns:
+        float: Between 0 and 1.
+    """
+    if not stats['prompt_tokens']:
+        return 0.0
+    return 1 - stats['evaluated_tokens'] / stats['prompt_tokens']
@@ -3,74 +3,158 @@ rag_embedding.py
 Embedding file for RAG memory access
 """
 import csv
-import ollama
+import os
+import threading
 import chromadb
 
 from conf_module import load_conf
+from embedding import embed
 
-MODEL=load_conf("EMBED_MODEL")
+MODEL = load_conf("EMBED_MODEL")
+MEMORY_FILE = "data.csv"
+DB_FOLDER = load_conf("MEMORY_DB_FOLDER")
 
-client = chromadb.Client()
-collection = client.create_collection(name="docs")
+client = chromadb.PersistentClient(path=DB_FOLDER)
+collection = None
 
-def read_memory(n, user, query) -> list:
+_lock = threading.Lock()
+
+def _read_rows() -> list:
     """
-    Read memory from CSV using RAG
-    
-    Args:
-        n (int): Number of relevant documents to retrieve
-        user (str): The user to whom the memory relates
-        query (str): The query to search relevant documents
-    
+    Read every memory row from the CSV file.
+
     Returns:
-        list: List of relevant documents
+        list: List of "user content" documents, in file order.
     """
+    if not os.path.exists(MEMORY_FILE):
+        return []
 
-    input = f"{user} {query}"
-    # Load documents from CSV
     documents = []
-    with open("data.csv", newline="", encoding="utf-8") as csvfile:
+    with open(MEMORY_FILE, newline="", encoding="utf-8") as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
             documents.append(f"{row['user']} {row['content']}")
+    return documents
+
+def _in_sync(documents: list) -> bool:
+    """
+    Check if the persistent index matches the CSV file.
+    Compares the row count and the last indexed row, which catches appends, truncations and edits at the end of the file.
+
+    Args:
+        documents (list): The documents currently stored in the CSV file.
+
+    Returns:
+        bool: True if the index can be used as is.
+    """
+    if collection.metadata.get("embed_model") != MODEL:
+        return False
+
+    if collection.count() != len(documents):
+        return False
+
+    if not documents:
+        return True
+
+    last = collection.get(ids=[str(len(documents) - 1)])
+    return last["documents"] == [documents[-1]]
+
+def _rebuild(documents: list) -> None:
+    """
+    Drop the index and embed every CSV row again.
+
+    Args:
+        documents (list): The documents to index.
+
+    Returns: None
+    """
+    global collection
 
-    # Embed and store each document
-    for i, d in enumerate(documents):
-        response = ollama.embed(model=MODEL, input=d)
-        embeddings = response["embeddings"]
+    print(f"[rag_embedding] Rebuilding memory index ({len(documents)} rows).")
+    client.delete_collection(name="memory")
+    collection = client.create_collection(name="memory", metadata={"embed_model": MODEL})
+
+    if documents:
         collection.add(
-            ids=[str(i)],
-            embeddings=embeddings,
-            documents=[d]
+            ids=[str(i) for i in range(len(documents))],
+            embeddings=embed(documents),
+            documents=documents
         )
 
+def _ensure_index() -> None:
+    """
+    Open the persistent index and rebuild it from the CSV only if they drifted apart.
+
+    Returns: None
+    """
+    global collection
+
+    if collection is not None:
+        return
+
+    collection = client.get_or_create_collection(name="memory", metadata={"embed_model": MODEL})
+    documents = _read_rows()
+    if not _in_sync(documents):
+        _rebuild(documents)
+
+def read_memory(n, user, query) -> list:
+    """
+    Read memory using RAG on the persistent index.
+
+    Args:
+        n (int): Number of relevant documents to retrieve
+        user (str): The user to whom the memory relates
+        query (str): The query to search relevant documents
+
+    Returns:
+        list: List of relevant documents
+    """
+    with _lock:
+        _ensure_index()
+        count = collection.count()
+
+    if count == 0:
+        return []
+
     # Generate embedding for input and search relevant document
-    response = ollama.embed(model=MODEL, input=input)
     results = collection.query(
-        query_embeddings=[response["embeddings"][0]],
-        n_results=n
+        query_embeddings=embed(f"{user} {query}"),
+        n_results=min(n, count)
     )
     data = results['documents'][0]
     return(data)
 
 def write_memory(user: str, content: str) -> None:
     """
-    Write memory to CSV
+    Write memory to CSV and embed it into the persistent index.
 
     Args:
         user (str): The user to whom the memory relates
         content (str): The content to store
-    
+
     Returns: None
     """
+    global collection
+
     fieldnames = ["user", "content"]
     try:
-        # Open CSV in append mode
-        with open("data.csv", "a", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            # If file is empty, write header
-            if csvfile.tell() == 0:
-                writer.writeheader()
-            writer.writerow({"user": user, "content": content})
+        with _lock:
+            _ensure_index()
+
+            # Open CSV in append mode
+            with open(MEMORY_FILE, "a", newline="", encoding="utf-8") as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                # If file is empty, write header
+                if csvfile.tell() == 0:
+                    writer.writeheader()
+                writer.writerow({"user": user, "content": content})
+
+            document = f"{user} {content}"
+            collection.add(
+                ids=[str(collection.count())],
+                embeddings=embed(document),
+                documents=[document]
+            )
     except Exception as e:
-        print(f"[write_memory] Error writing memory: {e}")
\ No newline at end of file
+        collection = None # Force a drift check on next access
+        print(f"[write_memory] Error writing memory: {e}")
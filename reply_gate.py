@@ -0,0 +1,147 @@
+"""
+reply_gate.py
+Cheap local decision on whether to reply to a guild message, before falling back to the MPCA LLM call
+"""
+import re
+import time
+import unicodedata
+from collections import Counter, deque
+
+import conf_module
+
+CUSTOM_EMOJI = re.compile(r"<a?:\w+:\d+>")
+
+# How often each decision path fired
+stats = Counter()
+
+# Recent (author id, is bot, time) per channel
+_history = {}
+
+def observe(msg) -> None:
+    """
+    Record a message in its channel history. Must be called for every message, including the bot's own.
+
+    Args:
+        msg (discord.Message): The received message.
+
+    Returns: None
+    """
+    length = conf_module.load_conf('GATE_EXCHANGE_LENGTH')
+    history = _history.get(msg.channel.id)
+    if history is None or history.maxlen != length:
+        history = _history[msg.channel.id] = deque(history or (), maxlen=length)
+    history.append((msg.author.id, msg.author.bot, time.monotonic()))
+
+def _is_emoji_only(msg) -> bool:
+    """
+    Check if a message is only emojis, punctuation or reaction-like chatter.
+
+    Args:
+        msg (discord.Message): The message.
+
+    Returns:
+        bool: True if there is nothing to reply to.
+    """
+    if msg.attachments:
+        return False
+
+    text = CUSTOM_EMOJI.sub("", msg.content)
+    for char in text:
+        if char.isspace():
+            continue
+        category = unicodedata.category(char)
+        if category in ("So", "Sk", "Mn", "Me", "Cf") or category.startswith("P"):
+            continue
+        return False
+    return True
+
+def _is_side_exchange(msg, bot_user) -> bool:
+    """
+    Check if two other users are having a rapid back-and-forth the bot isn't part of.
+
+    Args:
+        msg (discord.Message): The message, already observed.
+        bot_user (discord.ClientUser): The bot account.
+
+    Returns:
+        bool: True if the last GATE_EXCHANGE_LENGTH messages alternate between two humans within GATE_EXCHANGE_WINDOW seconds.
+    """
+    history = _history.get(msg.channel.id)
+    if not history or len(history) < history.maxlen:
+        return False
+
+    authors = [author for author, _, _ in history]
+    if bot_user.id in authors or any(is_bot for _, is_bot, _ in history):
+        return False
+
+    if len(set(authors)) != 2 or any(a == b for a, b in zip(authors, authors[1:])):
+        return False
+
+    return history[-1][2] - history[0][2] <= conf_module.load_conf('GATE_EXCHANGE_WINDOW')
+
+def _names_bot(msg, bot_user) -> bool:
+    """
+    Check if a message calls the bot by name.
+
+    Args:
+        msg (discord.Message): The message.
+        bot_user (discord.ClientUser): The bot account.
+
+    Returns:
+        bool: True if one of the bot names appears as a word.
+    """
+    names = {n.lower() for n in conf_module.load_conf('BOT_NAMES')}
+    names.add(bot_user.name.lower())
+    if getattr(bot_user, 'display_name', None):
+        names.add(bot_user.display_name.lower())
+
+    content = msg.content.lower()
+    return any(re.search(rf"(?<!\w){re.escape(name)}(?!\w)", content) for name in names if name)
+
+def addresses_bot(msg, bot_user) -> bool:
+    """
+    Check if a message is clearly meant for the bot: it mentions it, replies to it or names it.
+
+    Args:
+        msg (discord.Message): The message.
+        bot_user (discord.ClientUser): The bot account.
+
+    Returns:
+        bool: True if the message is addressed to the bot.
+    """
+    return (
+        bot_user in msg.mentions
+        or (msg.reference is not None and getattr(msg.reference.resolved, 'author', None) == bot_user)
+        or _names_bot(msg, bot_user)
+    )
+
+def decide(msg, bot_user):
+    """
+    Settle the obvious reply decisions without an LLM call.
+
+    Args:
+        msg (discord.Message): The guild message, already observed.
+        bot_user (discord.ClientUser): The bot account.
+
+    Returns:
+        bool: True to reply, False to stay silent, None if the MPCA should decide.
+    """
+    if bot_user in msg.mentions:
+        path, decision = "mention", True
+    elif msg.reference and getattr(msg.reference.resolved, 'author', None) == bot_user:
+        path, decision = "reply_to_bot", True
+    elif _names_bot(msg, bot_user):
+        path, decision = "name", True
+    elif _is_emoji_only(msg):
+        path, decision = "emoji", False
+    elif _is_side_exchange(msg, bot_user):
+        path, decision = "side_exchange", False
+    else:
+        path, decision = "mpca", None
+
+    stats[path] += 1
+    total = sum(stats.values())
+    if total % 100 == 0:
+        print(f"[reply_gate] {total} decisions: " + ", ".join(f"{k}={v}" for k, v in stats.most_common()))
+
+    return decision
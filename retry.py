@@ -0,0 +1,180 @@
+"""
+retry.py
+Resilient requests: retries with exponential backoff and jitter within a deadline, and hedged requests
+"""
+import asyncio
+import random
+import time
+from collections import deque
+
+import httpx
+from ollama._types import ResponseError
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504, 524} # Overloaded, restarting or timing out servers
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Tell if a failed request may succeed if sent again. Other errors (bad request, unknown model...) are fatal.
+
+    Args:
+        error (Exception): The raised error.
+
+    Returns:
+        bool: True for connection errors, timeouts and transient server errors.
+    """
+    if isinstance(error, ResponseError):
+        return error.status_code in RETRYABLE_STATUS
+    return isinstance(error, (ConnectionError, httpx.TransportError, asyncio.TimeoutError))
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """
+    Delay before a retry: exponential, with full jitter so clients that failed together don't retry together.
+
+    Args:
+        attempt (int): Number of the failed attempt, from 0.
+        base (float): Delay scale in seconds.
+        cap (float): Max delay in seconds.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def attempt_timeout(deadline: float, timeout: float = None) -> float:
+    """
+    Time given to an attempt: `timeout`, capped by the time left before the deadline.
+
+    Args:
+        deadline (float): time.monotonic() value after which no attempt is made.
+        timeout (float, optional): Max seconds per attempt. Defaults to None (the whole time left).
+
+    Raises:
+        asyncio.TimeoutError: If the deadline is reached.
+
+    Returns:
+        float: Seconds.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise asyncio.TimeoutError("Request deadline reached.")
+    return remaining if timeout is None else min(remaining, timeout)
+
+async def with_retries(call, retries: int, deadline: float, base: float, cap: float, timeout: float = None):
+    """
+    Await `call()` until it succeeds, a fatal error occurs, `retries` retries were made or the deadline is reached.
+    Each attempt is given `timeout` seconds, capped by the time left before the deadline, so a hung request
+    is retried instead of using up the whole deadline.
+
+    Args:
+        call (callable): Coroutine function making the request.
+        retries (int): Max retries after the first attempt.
+        deadline (float): time.monotonic() value after which no attempt is made.
+        base (float): Backoff delay scale in seconds.
+        cap (float): Max backoff delay in seconds.
+        timeout (float, optional): Max seconds per attempt. Defaults to None (the whole time left).
+
+    Raises:
+        asyncio.TimeoutError: If the deadline is reached.
+        Exception: The last error, if fatal or out of retries.
+
+    Returns:
+        The result of `call()`.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await asyncio.wait_for(call(), attempt_timeout(deadline, timeout))
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+
+            delay = backoff(attempt, base, cap)
+            if time.monotonic() + delay >= deadline:
+                raise
+            print(f"[retry] Attempt {attempt + 1} failed ({e!r}), retrying in {delay:.1f}s.")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+async def hedged(primary, hedge, delay: float):
+    """
+    Start `primary()`, and if it hasn't finished after `delay` seconds, start `hedge()` too (e.g. on another host).
+    The first successful result wins and the other request is cancelled.
+
+    Args:
+        primary (callable): Coroutine function making the request.
+        hedge (callable): Coroutine function making the duplicate request.
+        delay (float): Seconds to wait for the primary before hedging. None to never hedge.
+
+    Raises:
+        Exception: The error of the last request to fail, if both failed.
+
+    Returns:
+        The first successful result.
+    """
+    tasks = [asyncio.ensure_future(primary())]
+    if delay is None:
+        return await tasks[0]
+
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+
+        tasks.append(asyncio.ensure_future(hedge()))
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            if not pending:
+                raise done.pop().exception()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+class LatencyTracker:
+    """
+    Recent request durations per key (e.g. per model), to know when a request is unusually slow.
+
+    Args:
+        size (int, optional): Durations kept per key. Defaults to 200.
+        min_samples (int, optional): Durations needed before percentiles are reported. Defaults to 20.
+    """
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.size = size
+        self.min_samples = min_samples
+        self._durations = {}
+
+    def record(self, key, duration: float) -> None:
+        """
+        Add a request duration.
+
+        Args:
+            key: The tracked key.
+            duration (float): The duration in seconds.
+
+        Returns: None
+        """
+        durations = self._durations.get(key)
+        if durations is None:
+            durations = self._durations[key] = deque(maxlen=self.size)
+        durations.append(duration)
+
+    def percentile(self, key, p: float) -> float:
+        """
+        Get a percentile of the recent durations.
+
+        Args:
+            key: The tracked key.
+            p (float): The percentile, between 0 and 1.
+
+        Returns:
+            float: The duration in seconds, or None if there aren't enough samples yet.
+        """
+        durations = self._durations.get(key)
+        if durations is None or len(durations) < self.min_samples:
+            return None
+        ordered = sorted(durations)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
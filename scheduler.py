@@ -0,0 +1,179 @@
+"""
+scheduler.py
+Per-channel turn scheduling: bursts of messages are merged into one turn, a reply made stale by new messages
+is cancelled before it is sent, and DMs and messages addressed to the bot go first
+"""
+import asyncio
+import time
+
+from limiter import PrioritySemaphore
+
+class Turn:
+    """
+    Messages of a channel handled together.
+
+    Args:
+        messages (list): The discord messages, oldest first.
+        gates (list): The reply gate decision of each message (True, False or None).
+        urgent (bool): True for DMs and messages addressed to the bot.
+        ingested (set): Ids of the messages whose attachments are already saved (by a cancelled turn).
+        in_context (set, optional): Ids of the messages whose text is already saved (by a cancelled turn). Defaults to None.
+    """
+    def __init__(self, messages: list, gates: list, urgent: bool, ingested: set, in_context: set = None):
+        self.messages = messages
+        self.gates = gates
+        self.urgent = urgent
+        self.ingested = ingested
+        self.in_context = in_context if in_context is not None else set()
+        self.saved = False # The prompt is in the conversation, cancelling the turn won't lose it
+        self.sending = False # The reply started being sent, the turn can't be cancelled anymore
+
+class _Channel:
+    """
+    Scheduling state of one channel.
+    """
+    def __init__(self):
+        self.pending = [] # (message, gate) waiting for the debounce timer
+        self.ingested = set()
+        self.in_context = set()
+        self.urgent = False
+        self.first = None # Arrival time of the first pending message
+        self.last = None # Arrival time of the last message
+        self.gap = None # Moving average of the time between messages of a burst
+        self.timer = None
+        self.turn = None # Running turn
+        self.task = None
+
+class TurnScheduler:
+    """
+    Debounce the messages of each channel over a short window adapted to how fast people are typing,
+    then run `handler` once for the whole burst. Channels run concurrently, up to `slots` turns at once,
+    and urgent turns get the free slots first.
+
+    Args:
+        handler (callable): Coroutine function called with each Turn.
+        slots (int): Max turns running at once, all channels included.
+        min_delay (float): Debounce window of urgent messages, and min window of the others, in seconds.
+        max_delay (float): Max debounce window, in seconds.
+        max_wait (float): Max time a message can be held back by newer ones, in seconds.
+    """
+    def __init__(self, handler, slots: int, min_delay: float, max_delay: float, max_wait: float):
+        self.handler = handler
+        self.slots = PrioritySemaphore(slots)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self._channels = {}
+
+    def submit(self, msg, gate=None, urgent: bool = False) -> None:
+        """
+        Queue a message for the next turn of its channel, cancelling the current turn if its reply isn't sent yet.
+
+        Args:
+            msg (discord.Message): The message.
+            gate (bool, optional): The reply gate decision for this message. Defaults to None.
+            urgent (bool, optional): True for DMs and messages addressed to the bot. Defaults to False.
+
+        Returns: None
+        """
+        state = self._channels.get(msg.channel.id)
+        if state is None:
+            state = self._channels[msg.channel.id] = _Channel()
+
+        now = time.monotonic()
+        if state.last is not None and now - state.last < self.max_wait:
+            gap = now - state.last
+            state.gap = gap if state.gap is None else 0.7 * state.gap + 0.3 * gap
+        state.last = now
+
+        # A reply that doesn't account for the new message is stale. The cancelled messages go back in the queue,
+        # so the next turn still answers a mention or DM among them, without saving their text twice
+        if state.task is not None and not state.task.done() and not state.turn.sending:
+            state.task.cancel()
+            state.pending[:0] = list(zip(state.turn.messages, state.turn.gates))
+            state.urgent = state.urgent or state.turn.urgent
+            state.ingested |= state.turn.ingested
+            state.in_context |= state.turn.in_context
+            if state.turn.saved:
+                state.in_context.update(m.id for m in state.turn.messages)
+
+        state.pending.append((msg, gate))
+        state.urgent = state.urgent or urgent
+        if state.first is None:
+            state.first = now
+
+        if state.timer is not None:
+            state.timer.cancel()
+        state.timer = asyncio.get_running_loop().call_later(self._delay(state, now), self._start, msg.channel.id)
+
+    def _delay(self, state: _Channel, now: float) -> float:
+        """
+        Pick how long to wait for more messages: about 1.5x the usual gap within the current burst.
+
+        Args:
+            state (_Channel): The channel state.
+            now (float): Current time.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        if state.urgent:
+            return self.min_delay
+
+        if state.gap is None: # No burst measured yet
+            delay = (self.min_delay + self.max_delay) / 2
+        else:
+            delay = min(self.max_delay, max(self.min_delay, 1.5 * state.gap))
+        # Don't keep a message waiting forever in a never-ending burst
+        return max(0.0, min(delay, state.first + self.max_wait - now))
+
+    def _start(self, channel_id) -> None:
+        """
+        Turn the pending messages of a channel into a turn and run it after the channel's previous turn.
+
+        Args:
+            channel_id: The channel id.
+
+        Returns: None
+        """
+        state = self._channels[channel_id]
+        if not state.pending:
+            return
+
+        messages, gates = zip(*state.pending)
+        turn = Turn(list(messages), list(gates), state.urgent, state.ingested, state.in_context)
+        state.pending, state.ingested, state.in_context, state.urgent = [], set(), set(), False
+        state.first, state.timer = None, None
+
+        state.turn = turn
+        state.task = asyncio.create_task(self._run(turn, state.task))
+        state.task.add_done_callback(self._report)
+
+    async def _run(self, turn: Turn, previous: asyncio.Task) -> None:
+        """
+        Run a turn once the previous turn of its channel is over and a slot is free.
+
+        Args:
+            turn (Turn): The turn.
+            previous (asyncio.Task): The previous turn of the channel, or None.
+
+        Returns: None
+        """
+        if previous is not None and not previous.done():
+            await asyncio.wait({previous})
+
+        async with self.slots.hold(0 if turn.urgent else 1):
+            await self.handler(turn)
+
+    @staticmethod
+    def _report(task: asyncio.Task) -> None:
+        """
+        Print the error of a failed turn.
+
+        Args:
+            task (asyncio.Task): The finished turn.
+
+        Returns: None
+        """
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[scheduler] Turn failed: {task.exception()!r}")
@@ -0,0 +1,139 @@
+"""
+script_worker.py
+Worker process of the python tool: runs scripts sent by scripting.py one at a time, under resource limits.
+Protocol: one JSON job per line on stdin ({"script", "cpu_time", "max_output"}), one JSON result per line ({"output"}).
+Only uses the standard library, it runs in isolated mode.
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+
+try:
+    import resource
+except ImportError: # Not available on Windows, the wall-clock timeout still applies
+    resource = None
+
+class CappedOutput(io.TextIOBase):
+    """
+    Text stream keeping only the first `limit` characters written to it.
+
+    Args:
+        limit (int): Max characters kept.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+        self.truncated = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        keep = text[:max(0, self.limit - self.size)]
+        if keep:
+            self.parts.append(keep)
+            self.size += len(keep)
+        if len(keep) < len(text):
+            self.truncated = True
+        return len(text)
+
+    def getvalue(self) -> str:
+        value = "".join(self.parts)
+        if self.truncated:
+            value += "\n[... output truncated ...]"
+        return value
+
+def set_limits(memory_mb: int, file_mb: int) -> None:
+    """
+    Cap the memory and the size of the files the worker can use. Applies to every script it runs.
+
+    Args:
+        memory_mb (int): Max address space in MB.
+        file_mb (int): Max size of a written file in MB.
+
+    Returns: None
+    """
+    if resource is None:
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 1024 * 1024,) * 2)
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_mb * 1024 * 1024,) * 2)
+
+def set_cpu_limit(cpu_time: int) -> None:
+    """
+    Let the next script use `cpu_time` more seconds of CPU. The kernel kills the worker past it.
+
+    Args:
+        cpu_time (int): CPU seconds allowed for the script.
+
+    Returns: None
+    """
+    if resource is None:
+        return
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    limit = int(used.ru_utime + used.ru_stime) + cpu_time
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+def run_script(script: str, max_output: int) -> str:
+    """
+    Executes a Python script within a restricted environment.
+
+    Args:
+        script (str): Python code to execute.
+        max_output (int): Max characters of output returned.
+
+    Returns:
+        str: The output or error of the script execution.
+    """
+    # Redirect stdout and stderr to capture output
+    output = CappedOutput(max_output)
+    restricted_globals = {
+        "__builtins__": {
+            "print": print,
+            "range": range,
+            "len": len,
+            "str": str,
+            "int": int,
+            "__import__": __import__,
+        }
+    }
+    restricted_locals = {}
+
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            exec(script, restricted_globals, restricted_locals)
+    except Exception as e:
+        return f"Error during execution: {str(e) or type(e).__name__}"
+
+    return output.getvalue()
+
+def main() -> None:
+    """
+    Serve jobs until stdin is closed.
+
+    Returns: None
+    """
+    memory_mb, file_mb = int(sys.argv[1]), int(sys.argv[2])
+
+    # Keep a private copy of stdout for results, scripts writing to the raw file descriptors go nowhere
+    results = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+    set_limits(memory_mb, file_mb)
+
+    for line in sys.stdin:
+        job = json.loads(line)
+        set_cpu_limit(job["cpu_time"])
+        output = run_script(job["script"], job["max_output"])
+        results.write(json.dumps({"output": output}) + "\n")
+        results.flush()
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,122 @@
 """
 scripting.py
-Execute Python scripts in a restricted environment.
+Execute Python scripts in a restricted environment: a pool of pre-started worker processes (script_worker.py)
+with wall-clock and CPU timeouts, memory limits and capped output
 """
-import io
-import contextlib
+import asyncio
+import json
+import os
+import sys
+import tempfile
 
-def run_script(script: str) -> str:
+import conf_module
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "script_worker.py")
+
+_idle = None # asyncio.Queue of idle workers
+_sandbox = None # Working directory of the workers
+
+class _Worker:
+    """
+    A script_worker.py process and the number of scripts it ran.
+
+    Args:
+        process (asyncio.subprocess.Process): The worker process.
+    """
+    def __init__(self, process):
+        self.process = process
+        self.runs = 0
+
+async def _spawn() -> None:
+    """
+    Start a worker process and add it to the idle workers.
+
+    Returns: None
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-I", WORKER_PATH,
+        str(conf_module.load_conf('SCRIPT_MEMORY_MB')), str(conf_module.load_conf('SCRIPT_FILE_MB')),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        cwd=_sandbox
+    )
+    _idle.put_nowait(_Worker(process))
+
+async def _replace(worker: _Worker) -> None:
+    """
+    Stop a worker (stuck, crashed or recycled) and start a fresh one.
+
+    Args:
+        worker (_Worker): The worker to stop.
+
+    Returns: None
+    """
+    if worker.process.returncode is None:
+        worker.process.kill()
+    await worker.process.wait()
+
+    try:
+        await _spawn()
+    except Exception as e:
+        print(f"[scripting] Couldn't start a worker: {e}")
+
+def start() -> None:
+    """
+    Start the SCRIPT_WORKERS workers in the background, if not already done. Needs a running event loop.
+
+    Returns: None
+    """
+    global _idle, _sandbox
+
+    if _idle is not None:
+        return
+
+    _idle = asyncio.Queue()
+    _sandbox = tempfile.mkdtemp(prefix="scripts_")
+    for _ in range(conf_module.load_conf('SCRIPT_WORKERS')):
+        asyncio.create_task(_spawn())
+
+async def run_script(script: str) -> str:
     """
-    Executes a Python script within a restricted environment.
-    
+    Executes a Python script in a worker process. The worker is replaced if the script
+    runs out of time or memory, and recycled after SCRIPT_RECYCLE_AFTER scripts.
+
     Args:
         script (str): Python code to execute.
-    
+
     Returns:
         str: The output or error of the script execution.
     """
-    # Redirect stdout and stderr to capture output
-    output = io.StringIO()
-    restricted_globals = {
-        "__builtins__": {
-            "print": print,
-            "range": range,
-            "len": len,
-            "str": str,
-            "int": int,
-            "__import__": __import__,
-        }
-    }
-    restricted_locals = {}
+    start()
+    worker = await _idle.get()
+    healthy = False
+    timeout = conf_module.load_conf('SCRIPT_TIMEOUT')
 
     try:
-        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
-            exec(script, restricted_globals, restricted_locals)
-    except Exception as e:
-        return f"Error during execution: {e}"
-    
-    return output.getvalue()
\ No newline at end of file
+        job = {
+            "script": script,
+            "cpu_time": conf_module.load_conf('SCRIPT_CPU_TIME'),
+            "max_output": conf_module.load_conf('SCRIPT_MAX_OUTPUT')
+        }
+        worker.process.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+        await worker.process.stdin.drain()
+
+        line = await asyncio.wait_for(worker.process.stdout.readline(), timeout)
+        if not line:
+            return "Error during execution: the script was stopped (CPU time or memory limit reached)."
+
+        healthy = True
+        worker.runs += 1
+        return json.loads(line)["output"]
+
+    except asyncio.TimeoutError:
+        return f"Error during execution: the script took more than {timeout} seconds."
+    except (BrokenPipeError, ConnectionResetError):
+        return "Error during execution: the script worker crashed."
+
+    finally:
+        if healthy and worker.runs < conf_module.load_conf('SCRIPT_RECYCLE_AFTER'):
+            _idle.put_nowait(worker)
+        else:
+            asyncio.create_task(_replace(worker))
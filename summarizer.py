@@ -0,0 +1,73 @@
+"""
+summarizer.py
+Background rolling summarization, off the request path: runs when a conversation goes idle or nears its token budget
+"""
+import asyncio
+
+import conf_module
+from context_budget import summarize_count
+from conversation import Conversation
+from Llm import DEFAULT_MODEL, context_window, summarize_chat
+
+async def schedule(conversation: Conversation, model: str = DEFAULT_MODEL) -> None:
+    """
+    Plan the summarization of a conversation after a message: right away (in the background) if it
+    is over SUMMARIZE_AT of the budget, or once it stays idle for SUMMARY_IDLE_DELAY seconds if it is over SUMMARIZE_TO.
+
+    Args:
+        conversation (Conversation): The conversation that just changed.
+        model (str, optional): The model reading the conversation. Defaults to DEFAULT_MODEL.
+
+    Returns: None
+    """
+    if model is None:
+        model = DEFAULT_MODEL
+
+    # Any new message resets the idle timer
+    if conversation.summary_timer:
+        conversation.summary_timer.cancel()
+        conversation.summary_timer = None
+
+    budget = await context_window(model) - conf_module.load_conf('CONTEXT_RESERVE')
+    if conversation.tokens >= budget * conf_module.load_conf('SUMMARIZE_AT'):
+        _start(conversation, model, budget)
+    elif conversation.tokens > budget * conf_module.load_conf('SUMMARIZE_TO'):
+        loop = asyncio.get_running_loop()
+        delay = conf_module.load_conf('SUMMARY_IDLE_DELAY')
+        conversation.summary_timer = loop.call_later(delay, _start, conversation, model, budget)
+
+def _start(conversation: Conversation, model: str, budget: int) -> None:
+    """
+    Start a background summarization unless one is already running.
+
+    Args:
+        conversation (Conversation): The conversation to summarize.
+        model (str): The model to summarize with.
+        budget (int): The conversation token budget.
+
+    Returns: None
+    """
+    conversation.summary_timer = None
+    if conversation.summary_task is None or conversation.summary_task.done():
+        conversation.summary_task = asyncio.create_task(_run(conversation, model, budget))
+
+async def _run(conversation: Conversation, model: str, budget: int) -> None:
+    """
+    Fold the oldest messages into the rolling summary until the conversation is under SUMMARIZE_TO of the budget.
+
+    Args:
+        conversation (Conversation): The conversation to summarize.
+        model (str): The model to summarize with.
+        budget (int): The conversation token budget.
+
+    Returns: None
+    """
+    target = int(budget * conf_module.load_conf('SUMMARIZE_TO'))
+    num = summarize_count(conversation.token_counts, target, int(budget * conf_module.load_conf('SUMMARIZE_AT')))
+    if num == 0:
+        return
+
+    try:
+        await summarize_chat(conversation, num, model)
+    except Exception as e:
+        print(f"[summarizer] Summarization failed: {e}")
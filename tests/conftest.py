@@ -0,0 +1,178 @@
+"""
+conftest.py
+Tests import the bot modules from the repository root, where config.py is read from.
+Also provides stand-in HTTP servers for Ollama and web pages.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+class FakeOllama:
+    """
+    Minimal Ollama server: /api/ps, /api/show and /api/chat (streamed or not).
+
+    Args:
+        loaded (list, optional): Models reported by /api/ps. Defaults to none.
+        fail_status (int, optional): Status returned by every request while set. Defaults to None.
+        failures (int, optional): Only fail the first N requests. Defaults to None (all of them).
+        delay (float, optional): Seconds before answering a chat. Defaults to 0.
+        stall_after (int, optional): Streamed pieces sent before the server stops answering. Defaults to None.
+    """
+    def __init__(self, loaded: list = (), fail_status: int = None, failures: int = None, delay: float = 0, stall_after: int = None):
+        self.loaded = list(loaded)
+        self.fail_status = fail_status
+        self.failures = failures
+        self.delay = delay
+        self.stall_after = stall_after
+        self.requests = [] # Paths of the received requests
+
+        fake = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, data: dict) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _failing(self) -> bool:
+                fake.requests.append(self.path)
+                if fake.fail_status is None:
+                    return False
+                if fake.failures is not None:
+                    if fake.failures <= 0:
+                        return False
+                    fake.failures -= 1
+                self._json(fake.fail_status, {"error": "failure"})
+                return True
+
+            def do_GET(self):
+                if not self._failing():
+                    self._json(200, {"models": [{"name": m, "model": m} for m in fake.loaded]})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if self._failing():
+                    return
+                if self.path == "/api/show":
+                    self._json(200, {"capabilities": ["completion"], "model_info": {"llama.context_length": 32768}})
+                    return
+
+                time.sleep(fake.delay)
+                port = self.server.server_port
+                if not request.get("stream"):
+                    self._json(200, fake.chunk(f"hi from {port}", done=True))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(3):
+                    if fake.stall_after is not None and i >= fake.stall_after:
+                        time.sleep(5)
+                        return
+                    self._chunk(fake.chunk(f"p{i} "))
+                self._chunk(fake.chunk("", done=True))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, data: dict) -> None:
+                line = (json.dumps(data) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.link = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def chunk(content: str, done: bool = False) -> dict:
+        data = {"model": "m", "created_at": "2024-01-01T00:00:00Z", "message": {"role": "assistant", "content": content}, "done": done}
+        if done:
+            data["prompt_eval_count"] = 5
+        return data
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+class FakeWeb:
+    """
+    Web server with one page per path: "/slow..." answers after `delay` seconds, "/missing..." with a 404.
+
+    Args:
+        delay (float, optional): Seconds before answering a slow page. Defaults to 1.
+    """
+    def __init__(self, delay: float = 1):
+        self.delay = delay
+        self.requests = [] # Paths of the received requests
+
+        fake = self
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.requests.append(self.path)
+                if self.path.startswith("/slow"):
+                    time.sleep(fake.delay)
+                status = 404 if self.path.startswith("/missing") else 200
+                body = f"<html><body><article><p>Text of {self.path}, long enough to be kept.</p></article></body></html>".encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError: # The client gave up
+                    pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.link = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def fake_web():
+    """
+    A FakeWeb server, shut down after the test.
+    """
+    server = FakeWeb()
+    yield server
+    server.close()
+
+@pytest.fixture
+def fake_ollama():
+    """
+    Factory of FakeOllama servers, shut down after the test.
+    """
+    servers = []
+
+    def make(**kwargs) -> FakeOllama:
+        server = FakeOllama(**kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
@@ -0,0 +1,51 @@
+"""
+test_context_journal.py
+Journal recovery after a crash
+"""
+import asyncio
+
+import context_journal
+from context_journal import ContextJournal
+from conversation import ConversationStore
+
+def journal(tmp_path) -> ContextJournal:
+    return ContextJournal(str(tmp_path / "c.json"), str(tmp_path / "c.jsonl"))
+
+def test_entries_after_a_torn_line_are_kept(tmp_path):
+    first = journal(tmp_path)
+    for i in range(3):
+        first.append({"content": i})
+    context_journal.flush()
+    with open(first.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 4, "entry": {"cont') # Crash while appending
+
+    second = journal(tmp_path)
+    assert [e["content"] for e in second.load()] == [0, 1, 2]
+    for i in range(3, 6):
+        second.append({"content": i})
+    context_journal.flush()
+
+    assert [e["content"] for e in journal(tmp_path).load()] == [0, 1, 2, 3, 4, 5]
+
+def test_corrupted_line_is_skipped(tmp_path):
+    first = journal(tmp_path)
+    first.append({"content": 0})
+    context_journal.flush()
+    with open(first.journal_path, "a", encoding="utf-8") as f:
+        f.write("garbage\n")
+    first.append({"content": 1})
+    context_journal.flush()
+
+    assert [e["content"] for e in journal(tmp_path).load()] == [0, 1]
+
+def test_store_loads_once_for_concurrent_gets(tmp_path):
+    async def main():
+        store = ConversationStore(str(tmp_path), max_conversations=4, max_size=10_000)
+        first, second = await asyncio.gather(
+            store.get(1, initial=[{"role": "system", "content": "hi"}]),
+            store.get(1, initial=[{"role": "system", "content": "hi"}])
+        )
+        assert first is second
+        assert first.messages == [{"role": "system", "content": "hi"}]
+
+    asyncio.run(main())
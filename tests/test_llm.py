@@ -0,0 +1,108 @@
+"""
+test_llm.py
+Ollama requests against stand-in servers: retries on another host, deadlines and fallbacks
+"""
+import asyncio
+import time
+
+import pytest
+
+for module in ("ddgs", "readability", "bs4", "chromadb"):
+    pytest.importorskip(module)
+
+import conf_module
+import Llm
+from conversation import Conversation
+from ollama_pool import OllamaPool
+
+@pytest.fixture
+def use_hosts(monkeypatch):
+    """
+    Route Llm through a pool of the given hosts, with fast retries.
+    """
+    load_conf = conf_module.load_conf
+    values = {"RETRY_BASE_DELAY": 0.01, "RETRY_MAX_DELAY": 0.05, "REQUEST_RETRIES": 2, "REQUEST_ATTEMPT_TIMEOUT": 0.5}
+    monkeypatch.setattr(conf_module, "load_conf", lambda key: values[key] if key in values else load_conf(key))
+    monkeypatch.setattr(Llm, "model_info", {})
+    monkeypatch.setattr(Llm, "model_info_failed", {})
+
+    def use(*links) -> OllamaPool:
+        pool = OllamaPool(list(links), max_failures=3, eject_time=30)
+        monkeypatch.setattr(Llm, "pool", pool)
+        return pool
+
+    return use
+
+async def checked(pool: OllamaPool) -> OllamaPool:
+    await asyncio.gather(*(pool.check(host) for host in pool.hosts))
+    return pool
+
+def test_retry_goes_to_another_host(fake_ollama, use_hosts):
+    bad = fake_ollama(loaded=["m:latest"]) # Picked first: it has the model loaded
+    good = fake_ollama()
+
+    async def main():
+        await checked(use_hosts(bad.link, good.link))
+        bad.fail_status = 503
+        return await Llm.ollama_chat(route="c", model="m", messages=[{"role": "user", "content": "x"}])
+
+    response = asyncio.run(main())
+    assert response.message.content == f"hi from {good.server.server_port}"
+    assert bad.requests.count("/api/chat") == 1
+
+def test_hung_attempt_is_retried(fake_ollama, use_hosts):
+    slow = fake_ollama(loaded=["m:latest"], delay=3)
+    fast = fake_ollama()
+
+    async def main():
+        await checked(use_hosts(slow.link, fast.link))
+        started = time.monotonic()
+        response = await Llm.ollama_chat(route="c", model="m", messages=[{"role": "user", "content": "x"}])
+        return response, time.monotonic() - started
+
+    response, elapsed = asyncio.run(main())
+    assert response.message.content == f"hi from {fast.server.server_port}"
+    assert elapsed < 2
+
+def test_stream_apologizes_when_no_piece_came(fake_ollama, use_hosts):
+    stalled = fake_ollama(stall_after=0)
+    use_hosts(stalled.link)
+    conversation = Conversation("t", [{"role": "system", "content": "s"}])
+
+    async def main():
+        return [piece async for piece in Llm.chat_stream(conversation, "hi", model="m")]
+
+    assert asyncio.run(main()) == [Llm.RETRY_LATER]
+    assert conversation.messages[-1] == {"role": "user", "content": "hi"}
+
+def test_stream_keeps_partial_reply(fake_ollama, use_hosts):
+    stalled = fake_ollama(stall_after=1)
+    use_hosts(stalled.link)
+    conversation = Conversation("t", [{"role": "system", "content": "s"}])
+
+    async def main():
+        return [piece async for piece in Llm.chat_stream(conversation, "hi", model="m")]
+
+    assert asyncio.run(main()) == ["p0 "]
+    assert conversation.messages[-1] == {"role": "assistant", "content": "p0 "}
+
+def test_model_details_fall_back_when_ollama_is_down(use_hosts):
+    use_hosts("http://127.0.0.1:9") # Nothing listens there
+
+    async def main():
+        return await Llm.show_model("m"), await Llm.get_model_capabilities("m"), await Llm.context_window("m")
+
+    info, capabilities, window = asyncio.run(main())
+    assert info == {}
+    assert capabilities == []
+    assert window == (conf_module.load_conf("CONTEXT_WINDOW") or Llm.FALLBACK_CONTEXT_WINDOW)
+
+def test_model_details_are_cached(fake_ollama, use_hosts):
+    server = fake_ollama()
+    use_hosts(server.link)
+
+    async def main():
+        return [await Llm.context_window("m") for _ in range(3)]
+
+    assert asyncio.run(main()) == [min(32768, conf_module.load_conf("CONTEXT_WINDOW") or 32768)] * 3
+    assert server.requests.count("/api/show") == 1
@@ -0,0 +1,113 @@
+"""
+test_ollama_pool.py
+Host routing, health checks and ejection against stand-in Ollama servers
+"""
+import asyncio
+
+import pytest
+from ollama._types import ResponseError
+
+from ollama_pool import OllamaPool
+
+async def checked(pool: OllamaPool) -> OllamaPool:
+    await asyncio.gather(*(pool.check(host) for host in pool.hosts))
+    return pool
+
+def test_check_reads_loaded_models(fake_ollama):
+    cold = fake_ollama()
+    warm = fake_ollama(loaded=["m:latest"])
+    pool = asyncio.run(checked(OllamaPool([cold.link, warm.link])))
+
+    assert pool.hosts[1].loaded == {"m:latest"}
+    assert pool.pick("m") is pool.hosts[1]
+    assert pool.pick("m:latest") is pool.hosts[1]
+    assert pool.pick("other") is pool.hosts[0]
+
+def test_busy_host_is_avoided(fake_ollama):
+    pool = OllamaPool([fake_ollama().link, fake_ollama().link])
+    pool.hosts[0].inflight = 2
+    assert pool.pick() is pool.hosts[1]
+
+def test_conversation_sticks_to_its_host(fake_ollama):
+    pool = OllamaPool([fake_ollama().link, fake_ollama().link], sticky_slack=2)
+    host = pool.pick(route="c")
+    other = pool.hosts[1] if host is pool.hosts[0] else pool.hosts[0]
+
+    host.inflight = 2 # Still within the slack
+    assert pool.pick(route="c") is host
+    assert pool.pick() is other
+
+    host.inflight = 3 # Too busy: the conversation moves
+    assert pool.pick(route="c") is other
+    host.inflight = 0
+    assert pool.pick(route="c") is other
+
+def test_failing_host_is_ejected_and_readmitted(fake_ollama):
+    server = fake_ollama(fail_status=503)
+    backup = fake_ollama()
+    pool = OllamaPool([server.link, backup.link], max_failures=2, eject_time=30)
+    host = pool.hosts[0]
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(ResponseError):
+                async with pool.use("m", exclude=pool.hosts[1]) as used:
+                    assert used is host
+                    await used.client.chat(model="m", messages=[{"role": "user", "content": "x"}])
+        assert not host.healthy
+        assert pool.pick("m") is pool.hosts[1]
+
+        assert not await pool.check(host) # Still failing: stays ejected
+        server.fail_status = None
+        assert await pool.check(host)
+        assert host.healthy and host.failures == 0
+
+    asyncio.run(main())
+    assert host.inflight == 0
+
+def test_fatal_error_doesnt_count_against_the_host(fake_ollama):
+    server = fake_ollama(fail_status=404)
+    pool = OllamaPool([server.link], max_failures=1)
+
+    async def main():
+        with pytest.raises(ResponseError):
+            async with pool.use("m") as host:
+                await host.client.chat(model="m", messages=[{"role": "user", "content": "x"}])
+
+    asyncio.run(main())
+    assert pool.hosts[0].healthy and pool.hosts[0].failures == 0
+
+def test_cancelled_request_frees_its_slot(fake_ollama):
+    server = fake_ollama(delay=5)
+    pool = OllamaPool([server.link], max_failures=1)
+    host = pool.hosts[0]
+
+    async def request():
+        async with pool.use("m") as used:
+            await used.client.chat(model="m", messages=[{"role": "user", "content": "x"}])
+
+    async def main():
+        task = asyncio.create_task(request())
+        await asyncio.sleep(0.2)
+        assert host.inflight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert host.inflight == 0
+    assert host.healthy and host.failures == 0 and host.latency is None
+
+def test_success_updates_latency_and_models(fake_ollama):
+    server = fake_ollama()
+    pool = OllamaPool([server.link])
+
+    async def main():
+        async with pool.use("m") as host:
+            await host.client.chat(model="m", messages=[{"role": "user", "content": "x"}])
+
+    asyncio.run(main())
+    host = pool.hosts[0]
+    assert host.latency is not None and host.latency > 0
+    assert host.loaded == {"m:latest"}
+    assert host.inflight == 0
@@ -0,0 +1,113 @@
+"""
+test_retry.py
+Retries, deadlines and hedged requests with stand-in coroutines
+"""
+import asyncio
+import time
+
+import pytest
+from ollama._types import ResponseError
+
+from retry import LatencyTracker, hedged, is_retryable, with_retries
+
+class Flaky:
+    """
+    Request failing with the given errors before succeeding.
+
+    Args:
+        *errors (Exception): Errors raised by the first calls, in order. None for a call that only hangs.
+        hang (float, optional): Seconds the failing calls take. Defaults to 0.
+    """
+    def __init__(self, *errors: Exception, hang: float = 0):
+        self.errors = list(errors)
+        self.hang = hang
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            error = self.errors.pop(0)
+            await asyncio.sleep(self.hang)
+            if error is not None:
+                raise error
+        return "ok"
+
+def retry(call, retries: int = 3, deadline: float = 5, timeout: float = None):
+    return asyncio.run(with_retries(call, retries, time.monotonic() + deadline, 0.01, 0.02, timeout))
+
+def test_retryable_errors():
+    assert is_retryable(ResponseError("busy", 503))
+    assert is_retryable(ConnectionError())
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(ResponseError("model not found", 404))
+    assert not is_retryable(ValueError())
+
+def test_transient_errors_are_retried():
+    call = Flaky(ResponseError("busy", 503), ConnectionError())
+    assert retry(call) == "ok"
+    assert call.calls == 3
+
+def test_fatal_error_is_not_retried():
+    call = Flaky(ResponseError("model not found", 404))
+    with pytest.raises(ResponseError):
+        retry(call)
+    assert call.calls == 1
+
+def test_retries_are_limited():
+    call = Flaky(*[ResponseError("busy", 503)] * 5)
+    with pytest.raises(ResponseError):
+        retry(call, retries=2)
+    assert call.calls == 3
+
+def test_hung_attempt_is_retried():
+    call = Flaky(None, hang=10)
+    started = time.monotonic()
+    assert retry(call, timeout=0.1) == "ok"
+    assert call.calls == 2
+    assert time.monotonic() - started < 1
+
+def test_deadline_bounds_the_request():
+    call = Flaky(*[None] * 5, hang=10)
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        retry(call, deadline=0.2)
+    assert time.monotonic() - started < 1
+
+async def answer(value: str, after: float, error: Exception = None):
+    await asyncio.sleep(after)
+    if error is not None:
+        raise error
+    return value
+
+def test_fast_primary_isnt_hedged():
+    hedges = []
+    async def hedge():
+        hedges.append(1)
+        return "hedge"
+    assert asyncio.run(hedged(lambda: answer("primary", 0), hedge, 0.5)) == "primary"
+    assert hedges == []
+
+def test_slow_primary_loses_to_the_hedge():
+    started = time.monotonic()
+    assert asyncio.run(hedged(lambda: answer("primary", 10), lambda: answer("hedge", 0), 0.1)) == "hedge"
+    assert time.monotonic() - started < 1
+
+def test_failed_primary_falls_back_to_the_hedge():
+    result = asyncio.run(hedged(lambda: answer("primary", 0.2, ConnectionError()), lambda: answer("hedge", 0.4), 0.1))
+    assert result == "hedge"
+
+def test_both_failed():
+    with pytest.raises(ConnectionError):
+        asyncio.run(hedged(lambda: answer("primary", 0.2, ValueError()), lambda: answer("hedge", 0.3, ConnectionError()), 0.1))
+
+def test_latency_percentile_needs_samples():
+    tracker = LatencyTracker(size=10, min_samples=5)
+    for duration in range(4):
+        tracker.record("m", duration)
+    assert tracker.percentile("m", 0.9) is None
+    assert tracker.percentile("other", 0.9) is None
+
+    for duration in range(4, 20):
+        tracker.record("m", duration)
+    assert tracker.percentile("m", 0.9) == 19 # Only the last 10 durations are kept
+    assert tracker.percentile("m", 0) == 10
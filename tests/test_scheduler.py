@@ -0,0 +1,59 @@
+"""
+test_scheduler.py
+Turn coalescing and cancellation
+"""
+import asyncio
+from types import SimpleNamespace
+
+from scheduler import TurnScheduler
+
+def message(id: int):
+    return SimpleNamespace(id=id, channel=SimpleNamespace(id=1))
+
+async def wait_for_turns(turns: list, count: int) -> None:
+    while len(turns) < count:
+        await asyncio.sleep(0.01)
+
+def test_cancelled_saved_turn_keeps_its_gates():
+    async def main():
+        turns = []
+
+        async def handler(turn):
+            turns.append(turn)
+            if len(turns) == 1:
+                turn.saved = True # The prompt is in the conversation, the reply is being generated
+                await asyncio.sleep(10)
+
+        scheduler = TurnScheduler(handler, slots=2, min_delay=0.01, max_delay=0.05, max_wait=1)
+        scheduler.submit(message(1), gate=True, urgent=True)
+        await wait_for_turns(turns, 1)
+
+        scheduler.submit(message(2), gate=False)
+        await wait_for_turns(turns, 2)
+
+        retry = turns[1]
+        assert [m.id for m in retry.messages] == [1, 2]
+        assert retry.gates == [True, False]
+        assert retry.urgent
+        assert retry.in_context == {1}
+
+    asyncio.run(main())
+
+def test_burst_is_one_turn():
+    async def main():
+        turns = []
+
+        async def handler(turn):
+            turns.append(turn)
+
+        scheduler = TurnScheduler(handler, slots=1, min_delay=0.05, max_delay=0.1, max_wait=1)
+        for i in range(3):
+            scheduler.submit(message(i), gate=None)
+        await wait_for_turns(turns, 1)
+        await asyncio.sleep(0.2)
+
+        assert len(turns) == 1
+        assert [m.id for m in turns[0].messages] == [0, 1, 2]
+        assert not turns[0].in_context
+
+    asyncio.run(main())
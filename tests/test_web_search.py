@@ -0,0 +1,77 @@
+"""
+test_web_search.py
+Web search caching and deadlines, against a stand-in search backend and web server
+"""
+import time
+
+import pytest
+
+for module in ("ddgs", "readability", "bs4"):
+    pytest.importorskip(module)
+
+import web_search
+
+class FakeSearch:
+    """
+    Search backend whose results link to pages of a FakeWeb server.
+    """
+    def __init__(self, link: str):
+        self.link = link
+        self.paths = ["/a", "/b"] # Pages of the results
+        self.delay = 0 # Seconds before answering
+        self.calls = [] # Received queries
+
+    def __call__(self, query: str, num_results: int) -> list:
+        self.calls.append(query)
+        time.sleep(self.delay)
+        return [{"title": path, "href": self.link + path, "body": f"Snippet of {path}"} for path in self.paths][:num_results]
+
+@pytest.fixture
+def searches(monkeypatch, fake_web) -> FakeSearch:
+    """
+    Replace the search backend with a FakeSearch, and start from an empty cache.
+    """
+    monkeypatch.setattr(web_search, "_cache", web_search.OrderedDict())
+    fake = FakeSearch(fake_web.link)
+    monkeypatch.setattr(web_search, "search_function", fake)
+    return fake
+
+def test_repeated_query_makes_no_request(searches, fake_web):
+    first = web_search.search("Some  Query", deadline=5)
+    assert [r["page"] for r in first] == [f"Text of {path}, long enough to be kept." for path in ("/a", "/b")]
+
+    second = web_search.search("some query", deadline=5)
+    assert second == first
+    assert searches.calls == ["Some  Query"]
+    assert sorted(fake_web.requests) == ["/a", "/b"]
+
+def test_failed_page_is_cached(searches, fake_web):
+    searches.paths = ["/a", "/missing"]
+    first = web_search.search("query", deadline=5)
+    assert "page" in first[0] and "page" not in first[1]
+    assert first[1]["body"] == "Snippet of /missing"
+
+    web_search.search("query", deadline=5)
+    assert fake_web.requests.count("/missing") == 1
+    with pytest.raises(web_search.FetchError):
+        web_search.fetch_page(fake_web.link + "/missing")
+
+def test_late_search_times_out_and_fills_the_cache(searches):
+    searches.delay = 0.5
+    searches.paths = []
+    with pytest.raises(TimeoutError):
+        web_search.search("query", deadline=0.1)
+
+    time.sleep(0.6)
+    started = time.monotonic()
+    assert web_search.search("query", deadline=0.1) == []
+    assert time.monotonic() - started < 0.1
+    assert searches.calls == ["query"]
+
+def test_page_timeout_keeps_the_snippet(searches, fake_web):
+    searches.paths = ["/a", "/slow"]
+    started = time.monotonic()
+    results = web_search.search("query", deadline=0.5)
+    assert time.monotonic() - started < 0.9
+    assert "page" in results[0]
+    assert "page" not in results[1] and results[1]["body"] == "Snippet of /slow"
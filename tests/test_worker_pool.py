@@ -0,0 +1,42 @@
+"""
+test_worker_pool.py
+Process pool timeouts: a timed out job restarts the workers, the other jobs still complete
+"""
+import asyncio
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from worker_pool import WorkerPool
+
+def test_timeout_reruns_jobs_of_the_killed_pool():
+    async def main():
+        pool = WorkerPool(1, name="test")
+        try:
+            results = await asyncio.gather(
+                pool.run(time.sleep, 5, timeout=1.5),
+                *(pool.run(time.sleep, 0.1, timeout=30) for _ in range(4)),
+                return_exceptions=True
+            )
+            assert isinstance(results[0], asyncio.TimeoutError)
+            assert results[1:] == [None] * 4
+            await asyncio.sleep(0.1)
+            assert pool.pending == 0
+        finally:
+            pool.kill(pool.start())
+
+    asyncio.run(main())
+
+def test_crashing_job_raises_and_pool_recovers():
+    async def main():
+        pool = WorkerPool(1, name="test")
+        try:
+            with pytest.raises(BrokenProcessPool):
+                await pool.run(os._exit, 1, timeout=30)
+            assert await pool.run(time.sleep, 0, timeout=30) is None
+        finally:
+            pool.kill(pool.start())
+
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+transcription.py
+Audio transcription service: Whisper is loaded once per worker process, jobs go through a bounded queue
+"""
+import conf_module
+from worker_pool import WorkerPool
+
+WHISPER_MODEL_SIZE = conf_module.load_conf('WHISPER_MODEL_SIZE')
+USE_GPU = conf_module.load_conf('USE_GPU')
+WHISPER_WORKERS = conf_module.load_conf('WHISPER_WORKERS')
+WHISPER_QUEUE_SIZE = conf_module.load_conf('WHISPER_QUEUE_SIZE')
+
+_model = None # Whisper model of the current worker process
+
+def _detect_device(use_gpu: bool) -> str:
+    """
+    Pick the device Whisper should run on.
+
+    Args:
+        use_gpu (bool): Use the GPU if available.
+
+    Returns:
+        str: "cuda" or "cpu".
+    """
+    if not use_gpu:
+        return "cpu"
+
+    try:
+        import torch
+        if torch.cuda.is_available():
+            print(f"GPU detected: {torch.cuda.get_device_name(0)}")
+            return "cuda"
+        print("No GPU detected, using CPU.")
+    except Exception:
+        pass
+    return "cpu"
+
+def _init_worker(model_size: str, use_gpu: bool) -> None:
+    """
+    Load the Whisper model in a worker process. Runs once per worker.
+
+    Args:
+        model_size (str): The Whisper model size.
+        use_gpu (bool): Use the GPU if available.
+
+    Returns: None
+    """
+    global _model
+
+    import whisper
+    _model = whisper.load_model(model_size, device=_detect_device(use_gpu))
+
+def _warmup() -> bool:
+    """
+    No-op job, used to force workers (and their model) to load.
+
+    Returns:
+        bool: True once the worker is ready.
+    """
+    return _model is not None
+
+def _transcribe(filepath: str) -> str:
+    """
+    Transcribe a file with the worker's model.
+
+    Args:
+        filepath (str): Path to the audio file.
+
+    Returns:
+        str: The transcription.
+    """
+    result = _model.transcribe(filepath)
+    return result.get("text", "")
+
+# Whisper is loaded once in each worker process
+workers = WorkerPool(WHISPER_WORKERS, _init_worker, (WHISPER_MODEL_SIZE, USE_GPU), name="transcription")
+
+def start(preload: bool = False) -> None:
+    """
+    Start the worker pool if it isn't running.
+
+    Args:
+        preload (bool, optional): Load the model in every worker now instead of on the first transcription. Defaults to False.
+
+    Returns: None
+    """
+    running = workers.running
+    executor = workers.start()
+
+    if preload and not running:
+        for _ in range(WHISPER_WORKERS):
+            executor.submit(_warmup)
+
+async def transcribe(filepath: str, timeout: float = None) -> str:
+    """
+    Transcribe an audio file in the worker pool. A transcription past `timeout` restarts the workers,
+    so it stops counting against WHISPER_QUEUE_SIZE only once it really stopped.
+
+    Args:
+        filepath (str): Path to the audio file.
+        timeout (float, optional): Max seconds, queueing included. Defaults to None (no limit).
+
+    Raises:
+        RuntimeError: If WHISPER_QUEUE_SIZE transcriptions are already waiting.
+        asyncio.TimeoutError: If the transcription took too long.
+
+    Returns:
+        str: The transcription.
+    """
+    if workers.pending >= WHISPER_QUEUE_SIZE:
+        raise RuntimeError("Too many audio files are being transcribed, please retry later.")
+
+    return await workers.run(_transcribe, filepath, timeout=timeout)
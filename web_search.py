@@ -4,12 +4,205 @@ Web search and browsing functions (duckduckgo, readability...)
 """
 from ddgs import DDGS
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from readability import Document
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit, urlunsplit
 import random
+import threading
+import time
 
 import conf_module
 
+POOL_SIZE = conf_module.load_conf('WEB_POOL_SIZE')
+
+# Shared session: connections to the same hosts are reused across calls
+session = requests.Session()
+session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+session.mount("http://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+session.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="web_fetch")
+
+_cache = OrderedDict() # key -> (expiry time, value)
+_cache_lock = threading.Lock()
+
+def ddgs_search(query: str, num_results: int) -> list:
+    """
+    Search the web with DuckDuckGo.
+
+    Args:
+        query (str): The search query.
+        num_results (int): Max number of results.
+
+    Returns:
+        list: Results as dicts with "title", "href" and "body".
+    """
+    return DDGS().text(query, max_results=num_results)
+
+# Search backend used by browse, can be replaced (e.g. by a local stand-in)
+search_function = ddgs_search
+
+def _cache_get(key: str):
+    """
+    Get a cached value if it hasn't expired.
+
+    Args:
+        key (str): The cache key.
+
+    Returns:
+        The cached value, or None.
+    """
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry[1]
+
+def _cache_set(key: str, value, ttl: float = None) -> None:
+    """
+    Cache a value for `ttl` seconds, evicting the least recently used entries past WEB_CACHE_SIZE.
+
+    Args:
+        key (str): The cache key.
+        value: The value to cache.
+        ttl (float, optional): Seconds the value stays cached. Defaults to WEB_CACHE_TTL.
+
+    Returns: None
+    """
+    if ttl is None:
+        ttl = conf_module.load_conf('WEB_CACHE_TTL')
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + ttl, value)
+        _cache.move_to_end(key)
+        while len(_cache) > conf_module.load_conf('WEB_CACHE_SIZE'):
+            _cache.popitem(last=False)
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a URL so trivial variations share a cache entry: lowercase scheme and host, no fragment.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The normalized URL.
+    """
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+class FetchError(requests.RequestException):
+    """
+    A page failed to download recently, it isn't tried again before WEB_FAILURE_TTL seconds.
+    """
+
+def fetch_page(url: str, timeout: float = 10) -> str:
+    """
+    Download a webpage and extract its main text with Readability. Results are cached for WEB_CACHE_TTL seconds,
+    failures for WEB_FAILURE_TTL seconds.
+
+    Args:
+        url (str): The page URL.
+        timeout (float, optional): Max seconds to wait for the server. Defaults to 10.
+
+    Raises:
+        requests.RequestException: If the page can't be downloaded.
+
+    Returns:
+        str: The main text of the page, cut to WEB_PAGE_CHARS characters.
+    """
+    key = "page:" + normalize_url(url)
+    text = _cache_get(key)
+    if isinstance(text, FetchError):
+        raise text
+    if text is not None:
+        return text
+
+    try:
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        # Forbidden or slow sites are common, don't hit them again on every search
+        _cache_set(key, FetchError(str(e)), conf_module.load_conf('WEB_FAILURE_TTL'))
+        raise
+
+    # Use Readability to extract the main article
+    doc = Document(response.text)
+    html = doc.summary()
+
+    soup = BeautifulSoup(html, 'html.parser')
+    text = soup.get_text(separator='\n', strip=True)[:conf_module.load_conf('WEB_PAGE_CHARS')]
+    _cache_set(key, text)
+    return text
+
+def search_results(query: str, num_results: int) -> list:
+    """
+    Search the web with `search_function`. Results are cached for WEB_CACHE_TTL seconds.
+
+    Args:
+        query (str): The search query.
+        num_results (int): Max number of results.
+
+    Returns:
+        list: Results as dicts with "title", "href" and "body".
+    """
+    key = f"search:{num_results}:{' '.join(query.casefold().split())}"
+    results = _cache_get(key)
+    if results is None:
+        results = [dict(r) for r in search_function(query, num_results)]
+        _cache_set(key, results)
+    return results
+
+def search(query: str, num_results: int = 5, fetch_top: int = None, deadline: float = None) -> list:
+    """
+    Search the web and fetch the top results concurrently, all within the deadline. Pages not fetched in time
+    only keep their search snippet. Searches and pages are cached separately (see search_results and fetch_page),
+    so a repeated query makes no request, even if some of its pages failed.
+
+    Args:
+        query (str): The search query.
+        num_results (int, optional): Number of search results. Defaults to 5.
+        fetch_top (int, optional): Number of results whose page is fetched. Defaults to WEB_FETCH_TOP.
+        deadline (float, optional): Max seconds for the whole search. Defaults to WEB_FETCH_DEADLINE.
+
+    Raises:
+        TimeoutError: If the search itself didn't answer before the deadline.
+
+    Returns:
+        list: Results as dicts with "title", "href", "body", and "page" (the page text) for fetched ones.
+    """
+    if fetch_top is None:
+        fetch_top = conf_module.load_conf('WEB_FETCH_TOP')
+    if deadline is None:
+        deadline = conf_module.load_conf('WEB_FETCH_DEADLINE')
+
+    end = time.monotonic() + deadline
+    # A late search still fills the cache for the next call
+    pending = _executor.submit(search_results, query, num_results)
+    done, _ = wait([pending], timeout=deadline)
+    if not done:
+        raise TimeoutError(f"The search didn't answer within {deadline} seconds.")
+    results = [dict(r) for r in pending.result()]
+
+    futures = {}
+    for result in results[:fetch_top]:
+        remaining = end - time.monotonic()
+        if remaining <= 0 or not result.get("href"):
+            continue
+        futures[_executor.submit(fetch_page, result["href"], remaining)] = result
+
+    done, _ = wait(futures, timeout=max(0, end - time.monotonic()))
+    for future in done:
+        if future.exception() is None:
+            futures[future]["page"] = future.result()
+    return results
+
 def browse(query: str, num_results: int = 5) -> str:
     """
     Browse the web or search using DuckDuckGo.
@@ -19,29 +212,21 @@ def browse(query: str, num_results: int = 5) -> str:
         num_results (int): Number of search results to return if using DuckDuckGo.
     
     Returns:
-        str: The main text of the webpage if a URL is provided, otherwise search results.
+        str: The main text of the webpage if a URL is provided, otherwise search results with the text of the top pages.
     """
     query = query.strip()
 
     if query.lower().startswith(("http://", "https://")):
         try:
-            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-            response = requests.get(query, headers=headers, timeout=10)
-            response.raise_for_status()
-
-            # Use Readability to extract the main article
-            doc = Document(response.text)
-            html = doc.summary()
-
-            soup = BeautifulSoup(html, 'html.parser')
-            text = soup.get_text(separator='\n', strip=True)
-            return text[:1000]
-
+            return fetch_page(query)
         except Exception as e:
             return f"Error: {e}"
 
     else:
-        results = DDGS().text(query, max_results=num_results)
+        try:
+            results = search(query, num_results)
+        except Exception as e:
+            return f"Error: {e}"
         return {"query": query, "results": results}
 
 def gif(query: str) -> str:
@@ -65,7 +250,7 @@ def gif(query: str) -> str:
     }
 
     try:
-        response = requests.get(url, params=params)
+        response = session.get(url, params=params, timeout=10)
         response.raise_for_status()
         data = response.json()
 
@@ -0,0 +1,152 @@
+"""
+worker_pool.py
+Process pool with per-job timeouts: a job running past its timeout can't be stopped alone,
+so its pool is killed and replaced, and the other jobs of the killed pool run again in the new one
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+class WorkerPool:
+    """
+    Spawn-context process pool, started on first use.
+
+    Args:
+        workers (int): Worker processes.
+        initializer (callable, optional): Module level function run once in each worker. Defaults to None.
+        initargs (tuple, optional): Its arguments. Defaults to ().
+        name (str, optional): Name used in logs. Defaults to "worker_pool".
+
+    Example:
+        text = await pool.run(load_file.load_file, filepath, timeout=120)
+    """
+    def __init__(self, workers: int, initializer=None, initargs: tuple = (), name: str = "worker_pool"):
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.name = name
+        self._executor = None
+        self._killed = weakref.WeakSet() # Pools killed by a timeout, their jobs are run again
+        self._pending = 0
+        self._lock = threading.Lock() # Jobs finish in the executor's management thread
+
+    @property
+    def pending(self) -> int:
+        """
+        Count the jobs queued or running, including those given up on but not killed yet.
+
+        Returns:
+            int: The number of jobs.
+        """
+        return self._pending
+
+    @property
+    def running(self) -> bool:
+        """
+        Check if the pool is started.
+
+        Returns:
+            bool: True if worker processes may be up.
+        """
+        return self._executor is not None
+
+    def start(self) -> ProcessPoolExecutor:
+        """
+        Start the pool if it isn't running.
+
+        Returns:
+            ProcessPoolExecutor: The current pool.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"), # CUDA can't be used in forked processes
+                initializer=self.initializer,
+                initargs=self.initargs
+            )
+        return self._executor
+
+    def _done(self, _) -> None:
+        """
+        Count a job as finished (done, failed or killed).
+
+        Returns: None
+        """
+        with self._lock:
+            self._pending -= 1
+
+    def kill(self, executor: ProcessPoolExecutor) -> None:
+        """
+        Terminate the workers of a pool and replace it. Its unfinished jobs fail, and `run` submits them again.
+
+        Args:
+            executor (ProcessPoolExecutor): The pool to kill.
+
+        Returns: None
+        """
+        if self._executor is executor:
+            self._executor = None
+        if executor in self._killed:
+            return
+        self._killed.add(executor)
+
+        terminate = getattr(executor, "terminate_workers", None) # Python 3.14+
+        if terminate is not None:
+            terminate()
+            return
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+
+    async def run(self, func, *args, timeout: float = None):
+        """
+        Run a function in a worker. Past `timeout` seconds, the pool is killed to free the worker.
+
+        Args:
+            func (callable): A module level function.
+            *args: Its arguments.
+            timeout (float, optional): Max seconds for the job, queueing included. Defaults to None (no limit).
+
+        Raises:
+            asyncio.TimeoutError: If the job took too long.
+            BrokenProcessPool: If the worker died running the job (e.g. out of memory).
+
+        Returns:
+            The function result.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            executor = self.start()
+            future = executor.submit(func, *args)
+            with self._lock:
+                self._pending += 1
+            future.add_done_callback(self._done)
+
+            # The process future is inspected directly: its failure may be a kill for another job's timeout
+            waiter = asyncio.wrap_future(future)
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                done, _ = await asyncio.wait({waiter}, timeout=remaining)
+            except asyncio.CancelledError:
+                waiter.cancel() # Drops the job if it is still queued
+                raise
+
+            if not done:
+                waiter.cancel()
+                # A queued job is just dropped, a running one holds its worker until killed
+                if not future.cancel():
+                    print(f"[{self.name}] {func.__name__} timed out, restarting the workers.")
+                    self.kill(executor)
+                raise asyncio.TimeoutError(f"{func.__name__} took more than {timeout} seconds.")
+
+            if not waiter.cancelled():
+                waiter.exception() # Reported through `future`
+            if future.cancelled() or isinstance(future.exception(), BrokenProcessPool):
+                if executor in self._killed: # Killed for another job's timeout: run again in the new pool
+                    continue
+                self.kill(executor) # The job itself broke the pool (e.g. out of memory)
+            return future.result()